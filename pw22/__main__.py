@@ -1,45 +1,95 @@
+import os
 import pyglet
 import logging
 
-logging.basicConfig(format='%(asctime)s %(module)s %(levelname)s %(message)s', level=logging.DEBUG)
+from .scenes import SceneManager, GameScene
+from .clock import FixedTimestep
+from .generation import WorldGenerator
+from .profiler import Profiler, ProfilerOverlay
+from .assets import registry
+from .actors import PLAYER_TEXTURE
+from .render import TILE_IMAGES
+from .replay import InputRecorder
 
-# setup resource paths before importing any game code
-pyglet.resource.path = ['data', 'data/tiles']
-pyglet.resource.reindex()
 
-from .scenes import SceneManager, GameScene
+def main():
+    logging.basicConfig(format='%(asctime)s %(module)s %(levelname)s %(message)s', level=logging.DEBUG)
 
-window = pyglet.window.Window(width=1024, height=768, caption='The Nightmare')
+    # set PW22_STREAMING to play an endless world generated around the player
+    streaming = bool(os.environ.get('PW22_STREAMING'))
 
-scene_manager = SceneManager(window)
-scene_manager.push(GameScene(scene_manager))
+    # start the generation workers before any GL state exists, so none of it ends up in them
+    world_generator = None if streaming else WorldGenerator()
 
-clock_display = pyglet.clock.ClockDisplay()
+    window = pyglet.window.Window(width=1024, height=768, caption='The Nightmare')
 
-pyglet.gl.glEnable(pyglet.gl.GL_BLEND)
-pyglet.gl.glBlendFunc(pyglet.gl.GL_SRC_ALPHA, pyglet.gl.GL_ONE_MINUS_SRC_ALPHA)
+    # load the assets while the workers generate the first world
+    registry.preload(textures=[PLAYER_TEXTURE], images=TILE_IMAGES.values())
 
+    # set PW22_TRACE to a .csv or .json path to record the time of every frame section
+    profiler = Profiler(trace_path=os.environ.get('PW22_TRACE'))
+    profiler_overlay = ProfilerOverlay(profiler)
 
-@window.event
-def on_draw():
-    window.clear()
+    scene_manager = SceneManager(window, profiler)
+    game_scene = GameScene(scene_manager, world_generator, streaming)
+    scene_manager.push(game_scene)
 
-    try:
-        scene_manager.on_draw()
-    except IndexError:
-        pyglet.app.exit()
+    # set PW22_RECORD to a file path to record the session for python -m pw22.replay
+    recorder = None
+    if os.environ.get('PW22_RECORD'):
+        world = game_scene.get_world()
+        recorder = InputRecorder(
+            os.environ['PW22_RECORD'], world.get_seed(), 0 if streaming else world.get_size(), streaming
+        )
+        scene_manager.set_recorder(recorder)
 
-    pyglet.gl.glLoadIdentity()
-    clock_display.draw()
+    timestep = FixedTimestep(scene_manager.on_update)
 
+    clock_display = pyglet.clock.ClockDisplay()
 
-def on_update(dt):
-    try:
-        scene_manager.on_update(dt)
-    except IndexError:
-        pyglet.app.exit()
+    pyglet.gl.glEnable(pyglet.gl.GL_BLEND)
+    pyglet.gl.glBlendFunc(pyglet.gl.GL_SRC_ALPHA, pyglet.gl.GL_ONE_MINUS_SRC_ALPHA)
 
+    def on_draw():
+        window.clear()
 
-def main():
+        try:
+            scene_manager.on_draw(timestep.get_alpha())
+        except IndexError:
+            pyglet.app.exit()
+
+        pyglet.gl.glLoadIdentity()
+        clock_display.draw()
+        profiler_overlay.draw(window)
+        profiler.end_frame()
+
+    def on_key_press(symbol, modifiers):
+        if symbol == pyglet.window.key.F3:
+            profiler_overlay.toggle()
+            return pyglet.event.EVENT_HANDLED
+        # every other key goes on to the scene manager
+        return pyglet.event.EVENT_UNHANDLED
+
+    # window.event would write into the frame the scene manager pushed and replace its handlers,
+    # a frame of our own on top keeps both
+    window.push_handlers(on_draw, on_key_press)
+
+    def on_update(dt):
+        try:
+            timestep.tick(dt)
+        except IndexError:
+            pyglet.app.exit()
+
+    # tick once per frame so drawing runs as fast as the display allows, the timestep runs the
+    # simulation at its own rate from the accumulated dt and rendering interpolates in between
     pyglet.clock.schedule(on_update)
     pyglet.app.run()
+    if world_generator:
+        world_generator.shutdown()
+    profiler.close()
+    if recorder:
+        recorder.close()
+
+
+if __name__ == '__main__':
+    main()
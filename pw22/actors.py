@@ -1,11 +1,128 @@
 import pyglet
+from array import array
+from itertools import repeat
+from operator import add, mul, and_, not_, truth
 
-from .physics import Circle
+from .assets import registry
+from .physics import Circle, CONTACT_LEFT, CONTACT_RIGHT, CONTACT_BOTTOM, CONTACT_TOP
 
+PLAYER_TEXTURE = 'char.png'
+# collision radius of the player, kept apart from the texture so the simulation runs without it
+PLAYER_RADIUS = 16
 
-TEXTURE_PLAYER = pyglet.resource.texture('char.png')
-TEXTURE_PLAYER.anchor_x = TEXTURE_PLAYER.width / 2
-TEXTURE_PLAYER.anchor_y = TEXTURE_PLAYER.height / 2
+
+class ActorStore:
+    """
+    Struct of arrays holding the positions, velocities and last positions of many actors
+
+    Actors added to a store keep their state in its typed arrays instead of on the instance, index i
+    of every array belongs to the i-th actor added. Stepping, integrating and interpolating work on
+    whole arrays at once, the per actor work left is pushing the results to shapes and sprites.
+    """
+
+    def __init__(self):
+        self.x = array('d')
+        self.y = array('d')
+        self.velocity_x = array('d')
+        self.velocity_y = array('d')
+        self.last_x = array('d')
+        self.last_y = array('d')
+        self.render_x = array('d')
+        self.render_y = array('d')
+        # radius of the circle collided in the batched pass, 0 for actors outside it, and its contacts
+        self.radius = array('d')
+        self.contacts = array('B')
+        self.actors = []
+        self.shapes = []
+        self.sprites = []
+
+    def add(self, actor, collide=False):
+        """
+        Move the state of an actor into the store
+        :param collide: collide the circle of the actor against the world together with every other
+        actor of the store, see PhysicsSimulation.register_store and apply_contacts
+        """
+        velocity_x, velocity_y = actor.get_velocity()
+        self.x.append(actor.x)
+        self.y.append(actor.y)
+        self.velocity_x.append(velocity_x)
+        self.velocity_y.append(velocity_y)
+        self.last_x.append(actor.get_last_x())
+        self.last_y.append(actor.get_last_y())
+        # drawn where it is until the first interpolation
+        self.render_x.append(actor.x)
+        self.render_y.append(actor.y)
+        self.radius.append(actor.get_shape().radius if collide else 0.0)
+        self.contacts.append(0)
+        actor.set_store(self, len(self.actors))
+        self.actors.append(actor)
+        self.shapes.append(actor.get_shape())
+        self.sprites.append(actor.get_sprite())
+
+    def __len__(self):
+        return len(self.actors)
+
+    def begin_step(self):
+        """
+        Remember the current position of every actor as where the next simulation step starts from
+        """
+        self.last_x[:] = self.x
+        self.last_y[:] = self.y
+
+    def integrate(self, dt):
+        """
+        Move every actor by its velocity over dt
+        """
+        self.x[:] = array('d', map(add, self.x, map(mul, self.velocity_x, repeat(dt))))
+        self.y[:] = array('d', map(add, self.y, map(mul, self.velocity_y, repeat(dt))))
+
+    def sync_shapes(self):
+        """
+        Push the position of every actor to its physics shape
+        """
+        for shape, x, y in zip(self.shapes, self.x, self.y):
+            if shape:
+                shape.set_position(x, y)
+
+    def apply_contacts(self):
+        """
+        Stop every actor on each axis it touched a wall along in the last batched pass, its position
+        on that axis goes back to where the step started and its velocity along it drops to 0
+        """
+        horizontal = list(map(and_, self.contacts, repeat(CONTACT_LEFT | CONTACT_RIGHT)))
+        vertical = list(map(and_, self.contacts, repeat(CONTACT_BOTTOM | CONTACT_TOP)))
+        # multiplying by a bool keeps or zeroes a value, so each axis picks one of its two positions
+        for position, last, velocity, touched in (
+            (self.x, self.last_x, self.velocity_x, horizontal),
+            (self.y, self.last_y, self.velocity_y, vertical)
+        ):
+            free = list(map(not_, touched))
+            position[:] = array('d', map(add, map(mul, position, free), map(mul, last, map(truth, touched))))
+            velocity[:] = array('d', map(mul, velocity, free))
+
+    def update(self, dt):
+        """
+        One simulation step for every actor in the store, velocities are expected to be set already
+        """
+        self.begin_step()
+        self.integrate(dt)
+        self.sync_shapes()
+
+    def interpolate(self, alpha):
+        """
+        Place every sprite between the position before and after the last simulation step
+        :param alpha: fraction of a simulation step elapsed since the last one
+        """
+        # last + (x - last) * alpha, written as a blend so each term is a single map
+        self.render_x[:] = array('d', map(
+            add, map(mul, self.last_x, repeat(1.0 - alpha)), map(mul, self.x, repeat(alpha))
+        ))
+        self.render_y[:] = array('d', map(
+            add, map(mul, self.last_y, repeat(1.0 - alpha)), map(mul, self.y, repeat(alpha))
+        ))
+        for sprite, x, y in zip(self.sprites, self.render_x, self.render_y):
+            if sprite:
+                sprite.set_position(x, y)
 
 
 class Actor:
@@ -13,80 +130,196 @@ class Actor:
     Base class for all actors
     """
 
-    _x = 0
-    _y = 0
-    _last_x = 0
-    _last_y = 0
-    _batch = pyglet.graphics.Batch()
-    _sprite = None
-    _physics_shape = None
+    __slots__ = (
+        '_x', '_y', '_last_x', '_last_y', '_velocity_x', '_velocity_y',
+        '_batch', '_sprite', '_physics_shape', '_store', '_index'
+    )
+
+    def __init__(self, batch=None):
+        """
+        :param batch: pyglet batch the sprite of the actor is drawn with, actors without one
+        have no sprite and never touch GL, e.g. in headless simulations. See set_batch.
+        """
+        self._x = 0
+        self._y = 0
+        self._last_x = 0
+        self._last_y = 0
+        self._velocity_x = 0.0
+        self._velocity_y = 0.0
+        self._batch = None
+        self._sprite = None
+        self._physics_shape = None
+        self._store = None
+        self._index = None
+        if batch:
+            self.set_batch(batch)
 
     @property
     def x(self):
+        if self._store:
+            return self._store.x[self._index]
         return self._x
 
     @x.setter
     def x(self, value):
-        self._last_x = self._x
-        self._x = value
-        if self._sprite:
-            self._sprite.x = self._x
+        if self._store:
+            self._store.x[self._index] = value
+        else:
+            self._x = value
         if self._physics_shape:
-            self._physics_shape.x = self._x
+            self._physics_shape.x = value
 
     @property
     def y(self):
+        if self._store:
+            return self._store.y[self._index]
         return self._y
 
     @y.setter
     def y(self, value):
-        self._last_y = self._y
-        self._y = value
-        if self._sprite:
-            self._sprite.y = self._y
+        if self._store:
+            self._store.y[self._index] = value
+        else:
+            self._y = value
         if self._physics_shape:
-            self._physics_shape.y = self._y
+            self._physics_shape.y = value
+
+    def get_last_x(self):
+        if self._store:
+            return self._store.last_x[self._index]
+        return self._last_x
+
+    def get_last_y(self):
+        if self._store:
+            return self._store.last_y[self._index]
+        return self._last_y
+
+    def get_velocity(self):
+        if self._store:
+            return self._store.velocity_x[self._index], self._store.velocity_y[self._index]
+        return self._velocity_x, self._velocity_y
+
+    def set_velocity(self, x, y):
+        """
+        Set the velocity in pixels per second the actor moves at from the next step on
+        """
+        if self._store:
+            self._store.velocity_x[self._index] = x
+            self._store.velocity_y[self._index] = y
+        else:
+            self._velocity_x = x
+            self._velocity_y = y
+
+    def set_batch(self, batch):
+        """
+        Start drawing the actor with a batch, creating its sprite, or stop drawing it with None
+        """
+        if self._sprite:
+            self._sprite.delete()
+        self._batch = batch
+        self._sprite = self._create_sprite() if batch else None
+        if self._store:
+            self._store.sprites[self._index] = self._sprite
+
+    def _create_sprite(self):
+        """
+        :return: sprite of the actor in its batch, None for actors that are not drawn
+        """
+        return None
+
+    def set_store(self, store, index):
+        self._store = store
+        self._index = index
+
+    def set_position(self, x, y):
+        """
+        Move without interpolating from the previous position, for spawning and teleporting
+        """
+        self.x = x
+        self.y = y
+        self.begin_step()
+
+    def begin_step(self):
+        """
+        Remember the current position as where the next simulation step starts from
+        """
+        if self._store:
+            self._store.last_x[self._index] = self._store.x[self._index]
+            self._store.last_y[self._index] = self._store.y[self._index]
+        else:
+            self._last_x = self._x
+            self._last_y = self._y
+
+    def get_render_x(self):
+        """
+        :return: x the actor was last drawn at, placed by ActorStore.interpolate
+        """
+        return self._store.render_x[self._index]
+
+    def get_render_y(self):
+        """
+        :return: y the actor was last drawn at, placed by ActorStore.interpolate
+        """
+        return self._store.render_y[self._index]
 
     def get_shape(self):
         return self._physics_shape
 
-    def on_draw(self):
-        self._batch.draw()
+    def get_sprite(self):
+        return self._sprite
 
     def on_update(self, dt):
-        raise NotImplementedError()
+        """
+        Steer the actor, usually by setting its velocity. Actors moving at a constant velocity
+        don't need to override this, GameScene only calls it for actors that do.
+        """
+        pass
 
 
 class Player(Actor):
 
+    __slots__ = (
+        'should_move_left', 'should_move_right', 'should_move_up', 'should_move_down',
+        'left_move', 'right_move', 'up_move', 'down_move'
+    )
+
     VELOCITY = 200
 
-    should_move_left = False
-    should_move_right = False
-    should_move_up = False
-    should_move_down = False
+    def __init__(self, batch=None):
+        super().__init__(batch)
+        self.should_move_left = False
+        self.should_move_right = False
+        self.should_move_up = False
+        self.should_move_down = False
 
-    left_move = 0
-    right_move = 0
-    up_move = 0
-    down_move = 0
+        self.left_move = 0
+        self.right_move = 0
+        self.up_move = 0
+        self.down_move = 0
 
-    def __init__(self):
-        self._physics_shape = Circle(TEXTURE_PLAYER.width / 2)
+        self._physics_shape = Circle(PLAYER_RADIUS)
         self._physics_shape.set_callback(self._collision_callback)
-        self._sprite = pyglet.sprite.Sprite(
-            img=TEXTURE_PLAYER,
+
+    def _create_sprite(self):
+        texture = registry.texture(PLAYER_TEXTURE)
+        texture.anchor_x = texture.width / 2
+        texture.anchor_y = texture.height / 2
+        return pyglet.sprite.Sprite(
+            img=texture,
             batch=self._batch
         )
 
     def _collision_callback(self, **kwargs):
-        x = self._x
-        y = self._y
+        if kwargs.get('other'):
+            return  # touching another shape, nothing reacts to that yet
+
+        x = self.x
+        y = self.y
 
         if kwargs.get('left') or kwargs.get('right'):
-            x = self._last_x
+            x = self.get_last_x()
         if kwargs.get('top') or kwargs.get('bottom'):
-            y = self._last_y
+            y = self.get_last_y()
 
         self.x = x
         self.y = y
@@ -114,6 +347,5 @@ class Player(Actor):
         if self.should_move_down:
             force_y -= 1
 
-        # update position if we are moving
-        self.x += int((force_x * self.VELOCITY) * dt)
-        self.y += int((force_y * self.VELOCITY) * dt)
+        # the position itself is integrated together with every other actor
+        self.set_velocity(force_x * self.VELOCITY, force_y * self.VELOCITY)
@@ -0,0 +1,163 @@
+import os
+import mmap
+import ctypes
+import struct
+import logging
+import pyglet
+
+# directories searched for assets, pyglet.resource resolves them against the directory of the script
+RESOURCE_PATH = ['data', 'data/tiles']
+
+# atlas written by python -m pw22.bake, used instead of the loose images whenever it exists,
+# resolved with resolve_path so it is found next to the images the loader finds
+PACK_PATH = 'data/assets.pack'
+PACK_MAGIC = b'PW2A'
+# bump whenever the layout of the pack changes
+PACK_VERSION = 1
+# magic, version, atlas width, atlas height, number of images
+PACK_HEADER = struct.Struct('<4sHHHH')
+# longest file name a pack can hold, in bytes of utf-8
+PACK_NAME_SIZE = 32
+# file name, x, y, width and height of an image in the atlas
+PACK_ENTRY = struct.Struct('<{0}sHHHH'.format(PACK_NAME_SIZE))
+# pixel format of the atlas, rows run bottom to top
+PACK_FORMAT = 'RGBA'
+
+
+def resolve_path(path):
+    """
+    :return: the path resolved the way pyglet.resource resolves RESOURCE_PATH, against the directory
+    of the script instead of the working directory, absolute paths are kept as they are
+    """
+    return os.path.join(pyglet.resource.get_script_home(), path)
+
+
+class AssetPack:
+    """
+    Texture atlas baked by python -m pw22.bake
+
+    The file is memory mapped and its pixels are handed to GL as they are, nothing is decoded or
+    copied on the way. The texture is created on first use, so a pack can be opened before any GL
+    context exists.
+    """
+
+    def __init__(self, path=PACK_PATH):
+        with open(path, 'rb') as f:
+            # a private mapping is writable, which ctypes needs, without ever touching the file
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+        magic, version, self._width, self._height, count = PACK_HEADER.unpack_from(self._map)
+        if magic != PACK_MAGIC:
+            raise ValueError('Not an asset pack: {0}'.format(path))
+        if version != PACK_VERSION:
+            raise ValueError('Asset pack version {0} is not supported: {1}'.format(version, path))
+
+        self._regions = {}  # name -> x, y, width, height
+        offset = PACK_HEADER.size
+        for i in range(0, count):
+            name, x, y, width, height = PACK_ENTRY.unpack_from(self._map, offset)
+            self._regions[name.rstrip(b'\0').decode('utf-8')] = (x, y, width, height)
+            offset += PACK_ENTRY.size
+        self._offset = offset
+        self._texture = None
+
+    def __contains__(self, name):
+        return name in self._regions
+
+    def get_texture(self):
+        """
+        :return: the whole atlas as a texture, uploaded straight from the mapped file
+        """
+        if not self._texture:
+            logging.debug('Uploading {0}x{1} asset atlas'.format(self._width, self._height))
+            pixels = (ctypes.c_ubyte * (self._width * self._height * len(PACK_FORMAT))).from_buffer(
+                self._map, self._offset
+            )
+            self._texture = pyglet.image.ImageData(self._width, self._height, PACK_FORMAT, pixels).get_texture()
+        return self._texture
+
+    def get_region(self, name):
+        """
+        :return: a new texture region of the atlas holding the image
+        """
+        return self.get_texture().get_region(*self._regions[name])
+
+
+class AssetRegistry:
+    """
+    Loads images and textures on first use and keeps them for every later request
+
+    Nothing is read from disk or uploaded to GL until an asset is asked for, so modules can refer to
+    assets by name without paying for them on import. preload loads a list of assets up front, for
+    example while worlds are being generated.
+
+    If an AssetPack exists at pack_path every image in it is served as a region of its atlas, so all
+    of them share one texture. Images missing from the pack still load from the resource path.
+    """
+
+    def __init__(self, path=RESOURCE_PATH, pack_path=PACK_PATH):
+        self._path = list(path)
+        self._pack_path = pack_path
+        self._pack = None
+        self._loader = None
+        self._assets = {}
+
+    def get_pack(self):
+        """
+        :return: the AssetPack, None if there is none
+        """
+        if self._pack is None:
+            self._pack = False
+            pack_path = self._pack_path and resolve_path(self._pack_path)
+            if pack_path and os.path.isfile(pack_path):
+                logging.debug('Opening asset pack {0}'.format(pack_path))
+                self._pack = AssetPack(pack_path)
+        return self._pack or None
+
+    def _get_loader(self):
+        if not self._loader:
+            logging.debug('Indexing assets in {0}'.format(', '.join(self._path)))
+            self._loader = pyglet.resource.Loader(self._path)
+        return self._loader
+
+    def image(self, name):
+        """
+        :return: the image as pyglet.image.AbstractImage
+        """
+        key = ('image', name)
+        asset = self._assets.get(key)
+        if not asset:
+            logging.debug('Loading image {0}'.format(name))
+            asset = self._assets[key] = self._load(name, 'image')
+        return asset
+
+    def texture(self, name):
+        """
+        :return: the image as a texture of its own, or as a region of the pack atlas if it was baked
+        """
+        key = ('texture', name)
+        asset = self._assets.get(key)
+        if not asset:
+            logging.debug('Loading texture {0}'.format(name))
+            asset = self._assets[key] = self._load(name, 'texture')
+        return asset
+
+    def _load(self, name, kind):
+        pack = self.get_pack()
+        if pack and name in pack:
+            # a separate region per kind, so anchors set on one do not move the other
+            return pack.get_region(name)
+        return getattr(self._get_loader(), kind)(name)
+
+    def preload(self, textures=(), images=()):
+        """
+        Load assets ahead of their first use
+        """
+        for name in textures:
+            self.texture(name)
+        for name in images:
+            self.image(name)
+
+
+# registry shared by the game, created empty so importing it costs nothing
+registry = AssetRegistry()
@@ -1,108 +1,211 @@
+import heapq
 import logging
+from array import array
+from collections import OrderedDict
 
+PATH_CACHE_SIZE = 256
+PATH_CACHE_CELL_SIZE = 16
 
-class AStar:
-
-    _nodes = []
 
-    class Node:
+class Grid:
+    """
+    Flat, array backed node state for a square tile graph
 
-        parent = None
-        h = 0
-        g = 0
-        f = 0
+    Nodes are addressed by index (y * size + x). Tile values double as node weights, passing the
+    flat tile buffer of a world keeps the grid in sync with carved tiles for free. The grid is meant
+    to be built once per world, searches reuse it without any reset.
+    """
 
-        def __init__(self, x, y, weight):
-            self.x = x
-            self.y = y
-            self.weight = weight * 2
+    def __init__(self, tiles, size):
+        logging.debug('Creating grid')
+        self.size = size
+        count = size * size
 
-        def reset(self):
-            self.parent = None
-            self.h = 0
-            self.g = 0
-            self.f = 0
-
-    def __init__(self, graph, size):
-        logging.debug('Initializing AStar')
-        self._open = set()
-        self._closed = set()
-        self._size = size
-
-        logging.debug('Creating nodes')
-        for y in range(0, self._size):
-            self._nodes.append([])
-            for x in range(0, self._size):
-                self._nodes[y].append(AStar.Node(x, y, graph[y][x]))
-
-    def _reset(self):
-        self._open.clear()
-        self._closed.clear()
-
-        for nodes in self._nodes:
-            for node in nodes:
-                node.reset()
-
-    def _find_node(self, x, y):
-        try:
-            return self._nodes[y][x]
-        except IndexError:
-            logging.debug('Could not find node at x: {0}, y: {1}'.format(x, y))
-            return None
+        self.weight = tiles
+        self.g = array('l', [0]) * count
+        self.f = array('l', [0]) * count
+        self.parent = array('l', [-1]) * count
+        # id of the last search that opened/closed each node, a node whose
+        # stamp differs from the current search is treated as untouched
+        self.opened = array('L', [0]) * count
+        self.closed = array('L', [0]) * count
 
-    def _calculate_cost(self, node_a, node_b):
-        node_a.g = node_a.parent.g + 10
-        node_a.h = (abs(node_a.x - node_b.x) + abs(node_a.y - node_b.y))
-        node_a.f = node_a.g + node_a.h + node_a.weight
-
-    def _get_node_with_lowest_f(self):
-        lowest = None
-        for node in self._open:
-            if not lowest or node.f < lowest.f:
-                lowest = node
-        return lowest
-
-    def _neighbors(self, node):
-        for y in [-1, 0, 1]:
-            for x in [-1, 0, 1]:
-                if (x == 0 and y == 0) or ((x == 1 or x == -1) and (y == 1 or y == -1)):
-                    continue
 
-                nx = node.x + x
-                ny = node.y + y
-                if nx == -1 or nx == self._size or ny == -1 or ny == self._size:
-                    continue
+class AStar:
 
-                n = self._find_node(nx, ny)
-                if n:
-                    yield n
+    def __init__(self, grid):
+        logging.debug('Initializing AStar')
+        self._grid = grid
+        self._search = 0
+        self._bounds = None
 
-    def _construct_path(self, node):
+    def _construct_path(self, index):
+        size = self._grid.size
+        parent = self._grid.parent
         path = []
-        while node.parent:
-            path.append((node.x, node.y))
-            node = node.parent
+        while parent[index] != -1:
+            path.append((index % size, index // size))
+            index = parent[index]
         return path
 
+    def get_search_bounds(self):
+        """
+        A search only ever reads the weight of nodes it opens, so the same search gives the same
+        result for as long as no tile inside this rectangle changes
+        :return: x0, y0, x1, y1 of the inclusive rectangle around every node the last search opened
+        """
+        return self._bounds
+
     def find_path(self, sx, sy, ex, ey):
         logging.debug('Finding path between {0},{1} and {2},{3}'.format(sx, sy, ex, ey))
-        self._reset()
-
-        start_node = self._find_node(sx, sy)
-        end_node = self._find_node(ex, ey)
-
-        self._open.add(start_node)
+        # bumping the search id invalidates the state of every node at once
+        self._search += 1
+        search = self._search
+
+        grid = self._grid
+        size = grid.size
+        weight = grid.weight
+        g_cost = grid.g
+        f_cost = grid.f
+        parent = grid.parent
+        opened = grid.opened
+        closed = grid.closed
+
+        start = sy * size + sx
+        end = ey * size + ex
+
+        parent[start] = -1
+        g_cost[start] = 0
+        # manhattan distance scaled to the cost of a single step so it never overestimates
+        f_cost[start] = (abs(sx - ex) + abs(sy - ey)) * 10
+        opened[start] = search
+
+        # entries are (f, h, index), breaking f ties on the remaining estimate keeps the search
+        # from flooding the plateaus of equal f that a manhattan heuristic creates on open ground
+        open_heap = [(f_cost[start], f_cost[start], start)]
+        min_x = max_x = sx
+        min_y = max_y = sy
+
+        while open_heap:
+            f, _, current = heapq.heappop(open_heap)
+            # stale entry left behind by a decrease-key
+            if closed[current] == search or f != f_cost[current]:
+                continue
+
+            if current == end:
+                self._bounds = (min_x, min_y, max_x, max_y)
+                return self._construct_path(current)
+
+            closed[current] = search
+            cx = current % size
+            cy = current // size
+            current_g = g_cost[current]
+
+            for nx, ny in ((cx - 1, cy), (cx + 1, cy), (cx, cy - 1), (cx, cy + 1)):
+                if nx == -1 or nx == size or ny == -1 or ny == size:
+                    continue
 
-        while len(self._open) > 0:
-            current_node = self._get_node_with_lowest_f()
-            if current_node == end_node:
-                return self._construct_path(current_node)
+                node = ny * size + nx
+                if closed[node] == search:
+                    continue
 
-            self._open.remove(current_node)
-            self._closed.add(current_node)
+                # entering a tile costs a step plus its weight, so every step costs at least the 10
+                # the heuristic charges and the search stays admissible and consistent
+                g = current_g + 10 + weight[node] * 2
+                if opened[node] == search and g >= g_cost[node]:
+                    continue
 
-            for node in self._neighbors(current_node):
-                if node not in self._closed and node not in self._open:
-                    node.parent = current_node
-                    self._calculate_cost(node, end_node)
-                    self._open.add(node)
+                if opened[node] != search:
+                    opened[node] = search
+                    if nx < min_x:
+                        min_x = nx
+                    elif nx > max_x:
+                        max_x = nx
+                    if ny < min_y:
+                        min_y = ny
+                    elif ny > max_y:
+                        max_y = ny
+                parent[node] = current
+                g_cost[node] = g
+                h = (abs(nx - ex) + abs(ny - ey)) * 10
+                f_cost[node] = g + h
+                heapq.heappush(open_heap, (f_cost[node], h, node))
+
+        self._bounds = (min_x, min_y, max_x, max_y)
+        return []
+
+
+class PathCache:
+    """
+    Bounded LRU of paths keyed by start and end, invalidated by region
+
+    Every path is stored with the rectangle its search depended on and indexed in a coarse grid of
+    cells, so invalidating a changed rectangle only visits the paths registered in the cells it covers.
+    """
+
+    def __init__(self, capacity=PATH_CACHE_SIZE, cell_size=PATH_CACHE_CELL_SIZE):
+        self._capacity = capacity
+        self._cell_size = cell_size
+        self._entries = OrderedDict()  # (sx, sy, ex, ey) -> (path, bounds)
+        self._cells = {}  # (cx, cy) -> set of keys
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _cells_in(self, x0, y0, x1, y1):
+        size = self._cell_size
+        for cy in range(y0 // size, y1 // size + 1):
+            for cx in range(x0 // size, x1 // size + 1):
+                yield cx, cy
+
+    def get(self, sx, sy, ex, ey):
+        """
+        :return: the cached path, None on a miss. The path is shared, callers must not modify it
+        """
+        key = (sx, sy, ex, ey)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, sx, sy, ex, ey, path, bounds):
+        """
+        :param bounds: x0, y0, x1, y1 of the tiles the path depends on, see AStar.get_search_bounds
+        """
+        key = (sx, sy, ex, ey)
+        self._remove(key)
+        if len(self._entries) >= self._capacity:
+            self._remove(next(iter(self._entries)))
+
+        self._entries[key] = (path, bounds)
+        for cell in self._cells_in(*bounds):
+            self._cells.setdefault(cell, set()).add(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for cell in self._cells_in(*entry[1]):
+            keys = self._cells[cell]
+            keys.discard(key)
+            if not keys:
+                del self._cells[cell]
+
+    def invalidate(self, x0, y0, x1, y1):
+        """
+        Drop every path depending on a tile in the inclusive rectangle
+        """
+        stale = set()
+        for cell in self._cells_in(x0, y0, x1, y1):
+            for key in self._cells.get(cell, ()):
+                bounds = self._entries[key][1]
+                if bounds[0] <= x1 and bounds[2] >= x0 and bounds[1] <= y1 and bounds[3] >= y0:
+                    stale.add(key)
+
+        for key in stale:
+            self._remove(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._cells.clear()
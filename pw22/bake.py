@@ -0,0 +1,113 @@
+"""
+Bake the images of the game into a single pre-decoded texture atlas
+
+Run with python -m pw22.bake after changing any image in data. The pack is written to
+data/assets.pack by default and is picked up by the asset registry whenever it exists, so the game
+starts without scanning the data directories or decoding a single image. Delete the pack to go back
+to loading the loose files.
+"""
+import logging
+import argparse
+
+import pyglet
+
+from .assets import (
+    RESOURCE_PATH, PACK_PATH, PACK_MAGIC, PACK_VERSION, PACK_HEADER, PACK_NAME_SIZE, PACK_ENTRY, PACK_FORMAT,
+    resolve_path
+)
+from .actors import PLAYER_TEXTURE
+from .render import TILE_IMAGES
+
+# transparent pixels kept between images so filtering never bleeds one into the next
+BAKE_PADDING = 2
+# narrowest atlas tried, widened to the widest image if that does not fit
+BAKE_MIN_WIDTH = 128
+
+
+def _next_power_of_two(value):
+    power = 1
+    while power < value:
+        power *= 2
+    return power
+
+
+def _pack(sizes, width):
+    """
+    Place rectangles on shelves, tallest first
+    :param sizes: dict of name -> width, height
+    :param width: width of the atlas in pixels
+    :return: dict of name -> x, y and the height used
+    """
+    places = {}
+    x = y = shelf = 0
+    for name in sorted(sizes, key=lambda name: (-sizes[name][1], name)):
+        w, h = sizes[name]
+        if x + w + BAKE_PADDING > width:
+            x = 0
+            y += shelf
+            shelf = 0
+        places[name] = (x + BAKE_PADDING, y + BAKE_PADDING)
+        x += w + BAKE_PADDING
+        shelf = max(shelf, h + BAKE_PADDING)
+    return places, y + shelf + BAKE_PADDING
+
+
+def bake(names, output=None, path=RESOURCE_PATH):
+    """
+    Decode every image and write them packed into one atlas
+    :param names: file names of the images, looked up in path like the asset registry does
+    :param output: file to write the pack to, PACK_PATH where the asset registry looks for it if omitted
+    """
+    for name in names:
+        # the pack stores names in a fixed size field, a cut off name would never be found again
+        if len(name.encode('utf-8')) > PACK_NAME_SIZE:
+            raise ValueError('Image name longer than {0} bytes: {1}'.format(PACK_NAME_SIZE, name))
+    output = output or resolve_path(PACK_PATH)
+
+    loader = pyglet.resource.Loader(path)
+    pixels = {}
+    sizes = {}
+    for name in names:
+        logging.debug('Decoding {0}'.format(name))
+        image = pyglet.image.load(name, file=loader.file(name)).get_image_data()
+        pixels[name] = image.get_data(PACK_FORMAT, image.width * len(PACK_FORMAT))
+        sizes[name] = (image.width, image.height)
+
+    # widen the atlas until it is about as tall as it is wide, a square texture wastes the least
+    width = _next_power_of_two(max([BAKE_MIN_WIDTH] + [w + 2 * BAKE_PADDING for w, h in sizes.values()]))
+    places, height = _pack(sizes, width)
+    while height > width:
+        width *= 2
+        places, height = _pack(sizes, width)
+    height = _next_power_of_two(height)
+
+    # rows run bottom to top like every texture in GL, so the pixels upload as they are
+    stride = width * len(PACK_FORMAT)
+    atlas = bytearray(stride * height)
+    for name, (x, y) in places.items():
+        w, h = sizes[name]
+        row_bytes = w * len(PACK_FORMAT)
+        for row in range(0, h):
+            target = (y + row) * stride + x * len(PACK_FORMAT)
+            atlas[target:target + row_bytes] = pixels[name][row * row_bytes:(row + 1) * row_bytes]
+
+    with open(output, 'wb') as f:
+        f.write(PACK_HEADER.pack(PACK_MAGIC, PACK_VERSION, width, height, len(places)))
+        for name in sorted(places):
+            f.write(PACK_ENTRY.pack(name.encode('utf-8'), places[name][0], places[name][1], *sizes[name]))
+        f.write(atlas)
+
+    logging.info('Baked {0} images into a {1}x{2} atlas in {3}'.format(len(places), width, height, output))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pw22.bake', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--output', help='file to write the pack to, {0} by default'.format(PACK_PATH))
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(asctime)s %(module)s %(levelname)s %(message)s', level=logging.INFO)
+    bake([PLAYER_TEXTURE] + sorted(TILE_IMAGES.values()), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""
+Headless benchmarks for world generation, pathfinding and physics
+
+Run with python -m pw22.bench, nothing in here opens a window or touches GL.
+"""
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+
+from .world import World, TILE_SIZE, TILE_FLOOR, GENERATOR_VERSION
+from .physics import PhysicsSimulation, Circle
+from .actors import Actor, ActorStore
+
+BENCH_SIZES = [98, 256, 512]
+BENCH_SEEDS = [1, 2, 3]
+BENCH_PATHS = 200
+BENCH_CIRCLES = 500
+BENCH_STEPS = 60
+
+
+def _percentile(samples, percentile):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * percentile / 100.0), len(ordered) - 1)]
+
+
+def summarize(samples):
+    """
+    :return: dict of the count, total, mean, min, p50, p95 and max of a list of timings
+    """
+    return {
+        'count': len(samples),
+        'total': sum(samples),
+        'mean': sum(samples) / len(samples),
+        'min': min(samples),
+        'p50': _percentile(samples, 50),
+        'p95': _percentile(samples, 95),
+        'max': max(samples)
+    }
+
+
+class _Walker(Actor):
+    """
+    Actor with a bare circle and no collision callback, collided in bulk with its store like the
+    actors of a game scene
+    """
+
+    __slots__ = ()
+
+    def __init__(self, radius):
+        super().__init__()
+        self._physics_shape = Circle(radius)
+
+
+def _floor_tiles(world):
+    return [(x, y) for x, y, tile in world.get_tiles().non_empty() if tile == TILE_FLOOR]
+
+
+def bench_generate(size, seed):
+    world = World(size, seed)
+    start = time.perf_counter()
+    world.generate()
+    elapsed = time.perf_counter() - start
+    return world, {'size': size, 'seed': seed, 'seconds': elapsed, 'rooms': len(world.get_rooms())}
+
+
+def bench_find_path(world, queries, seed):
+    rng = random.Random(seed)
+    size = world.get_size()
+    samples = []
+    for i in range(0, queries):
+        sx, sy, ex, ey = (rng.randrange(1, size - 1) for j in range(0, 4))
+        start = time.perf_counter()
+        world.find_path(sx, sy, ex, ey)
+        samples.append(time.perf_counter() - start)
+
+    result = summarize(samples)
+    result.update({'size': size, 'seed': world.get_seed()})
+    return result
+
+
+def bench_physics(world, circles, steps, seed, batched):
+    rng = random.Random(seed)
+    floor = _floor_tiles(world)
+    simulation = PhysicsSimulation()
+    simulation.register_world(world)
+    store = ActorStore()
+    simulation.register_store(store)
+    for i in range(0, circles):
+        x, y = rng.choice(floor)
+        x = x * TILE_SIZE + rng.random() * TILE_SIZE
+        y = y * TILE_SIZE + rng.random() * TILE_SIZE
+        if batched:
+            actor = _Walker(TILE_SIZE / 4)
+            actor.set_position(x, y)
+            store.add(actor, True)
+            simulation.register_shape(actor.get_shape(), collide_world=False)
+        else:
+            circle = Circle(TILE_SIZE / 4)
+            circle.set_position(x, y)
+            simulation.register_shape(circle)
+
+    samples = []
+    for i in range(0, steps):
+        start = time.perf_counter()
+        simulation.on_update()
+        # batched contacts are only worth something once they are applied to the actors
+        store.apply_contacts()
+        samples.append(time.perf_counter() - start)
+
+    result = summarize(samples)
+    result.update({'size': world.get_size(), 'circles': circles, 'batched': batched})
+    return result
+
+
+def run(sizes, seeds, paths, circles, steps):
+    results = {
+        'python': platform.python_version(),
+        'generator_version': GENERATOR_VERSION,
+        'generate': [],
+        'find_path': [],
+        'physics': []
+    }
+
+    for size in sizes:
+        for seed in seeds:
+            world, result = bench_generate(size, seed)
+            results['generate'].append(result)
+            logging.info('Generated {size}x{size} world {seed} in {seconds:.3f}s'.format(**result))
+
+        # the remaining benchmarks run on the world of the last seed
+        results['find_path'].append(bench_find_path(world, paths, seeds[-1]))
+        for batched in (False, True):
+            results['physics'].append(bench_physics(world, circles, steps, seeds[-1], batched))
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pw22.bench', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=BENCH_SIZES)
+    parser.add_argument('--seeds', type=int, nargs='+', default=BENCH_SEEDS)
+    parser.add_argument('--paths', type=int, default=BENCH_PATHS, help='path queries per world size')
+    parser.add_argument('--circles', type=int, default=BENCH_CIRCLES, help='synthetic circles per simulation')
+    parser.add_argument('--steps', type=int, default=BENCH_STEPS, help='physics updates per simulation')
+    parser.add_argument('--output', help='file to write the JSON results to, stdout if omitted')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(asctime)s %(module)s %(levelname)s %(message)s', level=logging.INFO)
+    results = run(args.sizes, args.seeds, args.paths, args.circles, args.steps)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
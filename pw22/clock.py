@@ -0,0 +1,37 @@
+import logging
+
+SIMULATION_RATE = 60
+MAX_STEPS_PER_TICK = 5
+
+
+class FixedTimestep:
+    """
+    Runs a simulation callback in fixed steps, no matter how often or how irregularly it is ticked
+
+    Time left over between steps is kept in an accumulator, get_alpha exposes how far into the
+    next step the clock is so rendering can interpolate between the last two simulation states.
+    """
+
+    def __init__(self, callback, rate=SIMULATION_RATE, max_steps=MAX_STEPS_PER_TICK):
+        self.step = 1.0 / rate
+        self._callback = callback
+        self._max_steps = max_steps
+        self._accumulator = 0.0
+
+    def tick(self, dt):
+        self._accumulator += dt
+
+        steps = 0
+        while self._accumulator >= self.step:
+            if steps == self._max_steps:
+                # too far behind to catch up, drop the backlog instead of spiralling
+                logging.debug('Dropping {0:.3f}s of simulation time'.format(self._accumulator))
+                self._accumulator %= self.step
+                break
+
+            self._callback(self.step)
+            self._accumulator -= self.step
+            steps += 1
+
+    def get_alpha(self):
+        return self._accumulator / self.step
@@ -0,0 +1,81 @@
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from .world import World, WorldCache, WORLD_SIZE, pick_seed
+
+PREFETCH_WORLDS = 2
+
+
+def generate_world(size, seed, cache_directory=None):
+    """
+    Generate a world, runs inside a worker process so it must stay free of any GL state
+    :param cache_directory: optional snapshot cache to load the world from or store it in
+    """
+    if cache_directory:
+        return WorldCache(cache_directory).get(seed, size)
+
+    world = World(size, seed)
+    world.generate()
+    return world
+
+
+class WorldGenerator:
+    """
+    Generates worlds in worker processes and keeps a queue of finished ones ready to be played
+
+    Only the pure data part of a world (rooms, tunnels, tiles and spawn point) is built in the
+    workers, uploading it to the GPU is left to the main thread.
+    """
+
+    def __init__(self, size=WORLD_SIZE, prefetch=PREFETCH_WORLDS, workers=None, seeds=None, cache_directory=None):
+        """
+        :param seeds: optional iterable of seeds to generate in order, random seeds are used when omitted.
+        Once a finite iterable runs out no more worlds are generated.
+        :param cache_directory: optional directory of world snapshots shared by the workers
+        """
+        logging.info('Initializing WorldGenerator')
+        self._size = size
+        self._seeds = iter(seeds) if seeds is not None else None
+        self._cache_directory = cache_directory
+        self._executor = ProcessPoolExecutor(max_workers=workers)
+        self._queue = deque()
+        for i in range(0, prefetch):
+            self._submit()
+
+    def _next_seed(self):
+        if self._seeds is not None:
+            return next(self._seeds, None)
+        return pick_seed()
+
+    def _submit(self):
+        seed = self._next_seed()
+        if seed is None:
+            return
+        # checked here so a bad seed fails where it was given instead of in a worker
+        pick_seed(seed)
+        self._queue.append(self._executor.submit(generate_world, self._size, seed, self._cache_directory))
+
+    def is_ready(self):
+        """
+        :return: True if the next world can be taken without blocking, False while it is generated
+        or when a finite iterable of seeds has run out
+        """
+        return bool(self._queue) and self._queue[0].done()
+
+    def get(self):
+        """
+        Take the next world from the queue, blocking until it is generated,
+        and start generating a replacement for it
+        :raises RuntimeError: if a finite iterable of seeds has run out and every world was taken
+        """
+        if not self._queue:
+            raise RuntimeError('No worlds left to generate, every seed given has been used')
+        future = self._queue.popleft()
+        self._submit()
+        if not future.done():
+            logging.debug('Waiting for world generation')
+        return future.result()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,400 @@
+import re
+import heapq
+import logging
+from array import array
+
+from .world import TILE_FLOOR
+
+# width and height in tiles of the clusters tunnel networks are split into
+TUNNEL_CLUSTER_SIZE = 32
+
+
+class FlowField:
+    """
+    Breadth first distance map from a single target tile over the walkable tiles of a tile map
+
+    The field is rebuilt only when the target moves to another tile or a tile it covers is changed
+    through the tile map. Every tile reached remembers the
+    neighbour it was reached from, so any number of actors can look up their next step toward the
+    target in O(1) instead of running a search each.
+    """
+
+    def __init__(self, tiles, walkable=TILE_FLOOR, max_distance=None):
+        """
+        :param tiles: TileMap to build the field over
+        :param walkable: tile value actors can walk on
+        :param max_distance: optional number of steps to stop expanding the field at
+        """
+        self._tiles = tiles
+        self._walkable = walkable
+        self._max_distance = max_distance
+        self._target = None
+        # set when a tile the field covers changed, the next update rebuilds even on the same target
+        self._stale = False
+        # starts ahead of the reached stamps so nothing counts as reached before the first build
+        self._build = 1
+
+        count = tiles.size * tiles.size
+        self._distance = array('L', [0]) * count
+        self._next = array('l', [-1]) * count
+        # id of the build that reached each tile, tiles with an older id are unreachable
+        self._reached = array('L', [0]) * count
+        tiles.add_listener(self._tiles_changed)
+
+    def get_target(self):
+        return self._target
+
+    def update(self, x, y):
+        """
+        Move the target of the field, the field is only rebuilt if the target changed tile or
+        the tiles under it changed
+        :return: True if the field was rebuilt
+        """
+        if self._target == (x, y) and not self._stale:
+            return False
+
+        self._target = (x, y)
+        self._stale = False
+        self._rebuild(x, y)
+        return True
+
+    def _tiles_changed(self, x0, y0, x1, y1):
+        if self._target is None or self._max_distance is None:
+            self._stale = True
+            return
+        # one tile past the reach of the field, a wall opening up there extends it
+        reach = self._max_distance + 1
+        tx, ty = self._target
+        if x0 <= tx + reach and x1 >= tx - reach and y0 <= ty + reach and y1 >= ty - reach:
+            self._stale = True
+
+    def _rebuild(self, x, y):
+        self._build += 1
+        build = self._build
+
+        size = self._tiles.size
+        data = self._tiles.data
+        walkable = self._walkable
+        max_distance = self._max_distance
+        distance = self._distance
+        next_step = self._next
+        reached = self._reached
+
+        start = y * size + x
+        distance[start] = 0
+        next_step[start] = -1
+        reached[start] = build
+
+        # plain list as queue, head walks forward instead of popping
+        queue = [start]
+        head = 0
+        while head < len(queue):
+            current = queue[head]
+            head += 1
+            current_distance = distance[current] + 1
+            if max_distance is not None and current_distance > max_distance:
+                continue
+
+            cx = current % size
+            for node in (
+                current - 1 if cx > 0 else -1,
+                current + 1 if cx < size - 1 else -1,
+                current - size,
+                current + size
+            ):
+                if node < 0 or node >= len(data) or reached[node] == build or data[node] != walkable:
+                    continue
+
+                reached[node] = build
+                distance[node] = current_distance
+                next_step[node] = current
+                queue.append(node)
+
+    def get_distance(self, x, y):
+        """
+        :return: steps from the tile to the target, None if the target can't be reached from it
+        """
+        index = y * self._tiles.size + x
+        if self._reached[index] != self._build:
+            return None
+        return self._distance[index]
+
+    def next_step(self, x, y):
+        """
+        :return: x, y of the tile to move to next, None if the tile is the target or unreachable
+        """
+        size = self._tiles.size
+        index = y * size + x
+        if self._reached[index] != self._build:
+            return None
+
+        node = self._next[index]
+        if node == -1:
+            return None
+        return node % size, node // size
+
+
+class HierarchicalPath:
+    """
+    Route found by HierarchicalPathfinder, kept as waypoints and refined into tiles one leg at a time
+    """
+
+    def __init__(self, pathfinder, waypoints, regions):
+        self._pathfinder = pathfinder
+        self._waypoints = waypoints
+        self._regions = regions
+        self._leg = 0
+
+    def get_waypoints(self):
+        """
+        :return: x, y of the start, every portal passed and the end
+        """
+        size = self._pathfinder.get_size()
+        return [(index % size, index // size) for index in self._waypoints]
+
+    def has_next_leg(self):
+        return self._leg < len(self._regions)
+
+    def next_leg(self):
+        """
+        Refine the next leg into tiles
+        :return: x, y of every tile of the leg in walking order, without its first tile
+        """
+        leg = self._pathfinder.refine(self._waypoints[self._leg], self._waypoints[self._leg + 1], self._regions[self._leg])
+        self._leg += 1
+        return leg
+
+
+class HierarchicalPathfinder:
+    """
+    Two level pathfinder over the rooms and tunnels of a generated world
+
+    Every room is a region, and so is every connected stretch of tunnel outside the rooms within a
+    TUNNEL_CLUSTER_SIZE cluster. Walkable tiles next to another region are portals, the abstract graph
+    connects the portals of each region with the walking distance between them. Queries search the abstract graph and only refine
+    a leg into tiles when it is asked for, refined legs are cached.
+    """
+
+    def __init__(self, world, walkable=TILE_FLOOR):
+        logging.debug('Building hierarchical pathfinder')
+        self._tiles = world.get_tiles()
+        self._size = self._tiles.size
+        self._walkable = walkable
+        self._region = array('l', [-1]) * (self._size * self._size)
+        self._region_count = 0
+        self._room_count = len(world.get_rooms())
+        self._portals = {}  # region -> list of portal tiles
+        self._edges = {}  # portal tile -> list of (portal tile, cost, region)
+        self._legs = {}  # (from tile, to tile, region) -> refined tile path
+        # indices of every walkable tile, found with one scan in C
+        self._floor = [match.start() for match in re.finditer(re.escape(bytes((walkable,))), self._tiles.data)]
+
+        self._label_rooms(world.get_rooms())
+        self._label_tunnels()
+        self._find_portals()
+        self._connect_portals()
+        logging.debug('Built {0} regions and {1} portals'.format(self._region_count, len(self._edges)))
+
+    def get_size(self):
+        return self._size
+
+    def _label_rooms(self, rooms):
+        for room in rooms:
+            span = array('l', [self._region_count]) * (room.width + 1)
+            for y in range(room.y, room.y + room.height + 1):
+                start = y * self._size + room.x
+                self._region[start:start + room.width + 1] = span
+            self._region_count += 1
+
+    def _neighbors(self, index):
+        size = self._size
+        x = index % size
+        if x > 0:
+            yield index - 1
+        if x < size - 1:
+            yield index + 1
+        if index >= size:
+            yield index - size
+        if index < size * (size - 1):
+            yield index + size
+
+    def _label_tunnels(self):
+        data = self._tiles.data
+        region = self._region
+        walkable = self._walkable
+        for index in self._floor:
+            if region[index] != -1:
+                continue
+
+            # flood the connected tunnel tiles outside the rooms, without leaving the cluster
+            # so a long tunnel network is split into regions of bounded size
+            label = self._region_count
+            self._region_count += 1
+            cluster = self._cluster(index)
+            region[index] = label
+            queue = [index]
+            for current in queue:
+                for node in self._neighbors(current):
+                    if data[node] == walkable and region[node] == -1 and self._cluster(node) == cluster:
+                        region[node] = label
+                        queue.append(node)
+
+    def _cluster(self, index):
+        return (index % self._size) // TUNNEL_CLUSTER_SIZE, index // self._size // TUNNEL_CLUSTER_SIZE
+
+    def _find_portals(self):
+        data = self._tiles.data
+        region = self._region
+        walkable = self._walkable
+        for index in self._floor:
+            for node in self._neighbors(index):
+                # the side of a boundary with the lower region id is the portal, for a room
+                # and a tunnel that is always the room edge
+                if data[node] != walkable or region[node] <= region[index]:
+                    continue
+
+                # a portal belongs to the region of its own tile and to every region it leads into
+                if index not in self._edges:
+                    self._edges[index] = []
+                    self._portals.setdefault(region[index], []).append(index)
+                portals = self._portals.setdefault(region[node], [])
+                if index not in portals:
+                    portals.append(index)
+
+    def _distances(self, start, region_id, target=None):
+        """
+        Breadth first distances from a tile to every portal of a region, walking inside the region only
+        :param target: optional extra tile of the region to measure the distance to
+        :return: dict of portal tile -> steps
+        """
+        data = self._tiles.data
+        region = self._region
+        portals = set(self._portals.get(region_id, ()))
+        if target is not None:
+            portals.add(target)
+        distance = {start: 0}
+        found = {}
+        queue = [start]
+        for current in queue:
+            if current in portals:
+                found[current] = distance[current]
+                if len(found) == len(portals):
+                    break
+            # portals of other regions are entered but never walked through
+            if current != start and region[current] != region_id:
+                continue
+            for node in self._neighbors(current):
+                if node in distance or data[node] != self._walkable:
+                    continue
+                if region[node] == region_id or node in portals:
+                    distance[node] = distance[current] + 1
+                    queue.append(node)
+        return found
+
+    def _connect_portals(self):
+        for region_id, portals in self._portals.items():
+            for portal in portals:
+                for other, cost in self._distances(portal, region_id).items():
+                    if other != portal:
+                        self._edges[portal].append((other, cost, region_id))
+
+    def refine(self, start, end, region_id):
+        """
+        Tile path between two tiles of a region, walking inside the region only
+        :return: x, y of every tile in walking order, without the start tile
+        """
+        key = (start, end, region_id)
+        leg = self._legs.get(key)
+        if leg is not None:
+            return leg
+
+        data = self._tiles.data
+        region = self._region
+        parent = {start: -1}
+        queue = [start]
+        for current in queue:
+            if current == end:
+                break
+            if current != start and region[current] != region_id:
+                continue
+            for node in self._neighbors(current):
+                if node in parent or data[node] != self._walkable:
+                    continue
+                if region[node] == region_id or node == end:
+                    parent[node] = current
+                    queue.append(node)
+
+        leg = []
+        if end in parent:
+            node = end
+            while node != start:
+                leg.append((node % self._size, node // self._size))
+                node = parent[node]
+            leg.reverse()
+
+        self._legs[key] = leg
+        return leg
+
+    def find_path(self, sx, sy, ex, ey):
+        """
+        :return: HierarchicalPath between the tiles, None if either tile is not walkable or no route exists
+        """
+        start = sy * self._size + sx
+        end = ey * self._size + ex
+        data = self._tiles.data
+        if data[start] != self._walkable or data[end] != self._walkable:
+            return None
+        start_region = self._region[start]
+        end_region = self._region[end]
+
+        if start == end:
+            return HierarchicalPath(self, [start, end], [start_region])
+
+        # temporary edges from the start into the abstract graph and from it to the end, within one
+        # region the direct walk is just another edge since leaving the region can still be shorter
+        target = end if start_region == end_region else None
+        start_edges = [
+            (portal, cost, start_region) for portal, cost in self._distances(start, start_region, target).items()
+        ]
+        end_edges = {}
+        for portal, cost in self._distances(end, end_region).items():
+            end_edges[portal] = cost
+
+        # dijkstra over the portals, entries are (cost, tile)
+        costs = {start: 0}
+        previous = {start: (None, None)}
+        open_heap = [(0, start)]
+        while open_heap:
+            cost, current = heapq.heappop(open_heap)
+            if cost != costs[current]:
+                continue
+            if current == end:
+                break
+
+            edges = self._edges.get(current, [])
+            if current == start:
+                edges = edges + start_edges
+            if current in end_edges:
+                edges = edges + [(end, end_edges[current], end_region)]
+
+            for node, edge_cost, region_id in edges:
+                node_cost = cost + edge_cost
+                if node not in costs or node_cost < costs[node]:
+                    costs[node] = node_cost
+                    previous[node] = (current, region_id)
+                    heapq.heappush(open_heap, (node_cost, node))
+
+        if end not in previous:
+            return None
+
+        waypoints = []
+        regions = []
+        node = end
+        while node is not None:
+            waypoints.append(node)
+            node, region_id = previous[node]
+            if node is not None:
+                regions.append(region_id)
+        waypoints.reverse()
+        regions.reverse()
+        return HierarchicalPath(self, waypoints, regions)
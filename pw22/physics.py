@@ -1,38 +1,85 @@
-import pyglet
 import math
 import logging
+from array import array
+from itertools import repeat, groupby
+from operator import add, sub, mul, floordiv, lt, gt
 
-from .world import TILE_SIZE, TILE_WALL
+from .world import TileMap, TILE_SIZE, TILE_WALL
 
-class PhysicsSimulation:
+# translation table turning flat tiles into 1 for walls and 0 for everything else
+_WALL_MASK = bytes(1 if tile == TILE_WALL else 0 for tile in range(0, 256))
+
+# x, y of the tile a circle is in and its eight neighbours, relative to it
+_OFFSETS = [(ox, oy) for oy in (-1, 0, 1) for ox in (-1, 0, 1)]
+
+# contact flags reported by batched collision, the names match the callback keywords
+CONTACT_LEFT = 1
+CONTACT_RIGHT = 2
+CONTACT_BOTTOM = 4
+CONTACT_TOP = 8
 
-    _shapes = []
-    _world = None
-    _batch = pyglet.graphics.Batch()
+
+class PhysicsSimulation:
 
     def __init__(self):
         logging.info('Initializing PhysicsWorld')
-        pass
+        self._shapes = []
+        self._batched_shapes = []
+        self._stores = []
+        self._world = None
+        self._spatial_hash = SpatialHash(TILE_SIZE)
 
-    def register_shape(self, shape):
-        self._shapes.append(shape)
+    def register_shape(self, shape, collide_world=True):
+        """
+        Register a shape that gets a callback for every contact
+        :param collide_world: False for the shape of an actor collided against the world with its
+        ActorStore, it then only gets callbacks for touching other shapes
+        """
+        if collide_world:
+            self._shapes.append(shape)
+        else:
+            self._batched_shapes.append(shape)
+        shape.set_spatial_hash(self._spatial_hash)
+
+    def register_store(self, store):
+        """
+        Collide the actors of an ActorStore against the world in one batched pass every update, the
+        contacts are left in store.contacts for ActorStore.apply_contacts
+        """
+        self._stores.append(store)
 
     def register_world(self, world):
-        self._world = PhysicsWorld(world)
+        """
+        :param world: World to collide shapes against, None to let go of the current one
+        """
+        self._world = PhysicsWorld(world) if world else None
 
     def on_update(self):
         # check all shapes against the world
         for shape in self._shapes:
             self._world.collide(shape)
+        for store in self._stores:
+            self._world.collide_batch(store.x, store.y, store.radius, store.contacts)
 
-    def on_draw(self):
-        for shape in self._shapes:
-            shape.debug_draw()
+        # check shapes sharing a cell against each other
+        for a, b in self._spatial_hash.pairs():
+            if shapes_collide(a, b):
+                a.callback(other=b)
+                b.callback(other=a)
+
+    def get_circles(self):
+        """
+        :return: every circle of the simulation, whether it gets callbacks or is collided with an ActorStore
+        """
+        return [shape for shape in self._shapes + self._batched_shapes if isinstance(shape, Circle)]
 
 
 class PhysicsWorld:
 
     def __init__(self, world):
+        """
+        :param world: World or ChunkedWorld, tiles are only read through the tile accessor it hands out
+        """
         self._world = world
         self._tiles = self._world.get_tiles()
 
@@ -41,14 +88,16 @@ class PhysicsWorld:
         Crappy collision code begins here
         :param obj: circle shape to try collision against
         """
-        ix = int(obj.x / TILE_SIZE)
-        iy = int(obj.y / TILE_SIZE)
+        # floored, a streaming world has tiles left of and below the origin
+        ix = int(obj.x // TILE_SIZE)
+        iy = int(obj.y // TILE_SIZE)
+        get_tile = self._tiles.get_tile
 
         for x in [-1, 0, 1]:
             for y in [-1, 0, 1]:
                 tx = ix + x
                 ty = iy + y
-                tile = self._tiles[ty][tx]
+                tile = get_tile(tx, ty)
                 if tile == TILE_WALL:
                     nx = max(tx * TILE_SIZE, min(obj.x, (tx * TILE_SIZE) + TILE_SIZE))
                     ny = max(ty * TILE_SIZE, min(obj.y, (ty * TILE_SIZE) + TILE_SIZE))
@@ -56,61 +105,299 @@ class PhysicsWorld:
                     dy = obj.y - ny
                     if (math.pow(dx, 2) + math.pow(dy, 2)) < math.pow(obj.radius, 2):
                         data = {}
-                        if obj.x < tx * TILE_SIZE and not self._tiles[ty][tx - 1] == TILE_WALL:
+                        if obj.x < tx * TILE_SIZE and not get_tile(tx - 1, ty) == TILE_WALL:
                             data['left'] = True
-                        elif obj.x > (tx * TILE_SIZE) + TILE_SIZE and not self._tiles[ty][tx + 1] == TILE_WALL:
+                        elif obj.x > (tx * TILE_SIZE) + TILE_SIZE and not get_tile(tx + 1, ty) == TILE_WALL:
                             data['right'] = True
-                        if obj.y < ty * TILE_SIZE and not self._tiles[ty - 1][tx] == TILE_WALL:
+                        if obj.y < ty * TILE_SIZE and not get_tile(tx, ty - 1) == TILE_WALL:
                             data['bottom'] = True
-                        elif obj.y > (ty * TILE_SIZE) + TILE_SIZE and not self._tiles[ty + 1][tx] == TILE_WALL:
+                        elif obj.y > (ty * TILE_SIZE) + TILE_SIZE and not get_tile(tx, ty + 1) == TILE_WALL:
                             data['top'] = True
                         obj.callback(**data)
 
+    def _gather_walls(self, ix, iy):
+        """
+        :param ix: tile x of every circle
+        :param iy: tile y of every circle
+        :return: dict of x, y offset -> bytes holding a 1 for every circle whose tile at that offset is a wall
+        """
+        tiles = self._tiles
+        if isinstance(tiles, TileMap):
+            return _gather_walls(tiles.data, tiles.size, ix, iy, 0, 0)
+
+        # a chunked world is read one chunk of circles at a time, a window spanning circles far apart
+        # would page in every chunk between them
+        size = tiles.get_chunk_size()
+        chunks = list(zip(map(floordiv, ix, repeat(size)), map(floordiv, iy, repeat(size))))
+        order = sorted(range(0, len(ix)), key=chunks.__getitem__)
+        parts = {offset: [] for offset in _OFFSETS}
+        for chunk, group in groupby(order, chunks.__getitem__):
+            group = list(group)
+            group_x = list(map(ix.__getitem__, group))
+            group_y = list(map(iy.__getitem__, group))
+            # the circles of the chunk and the tiles around them, so it reaches at most one tile into a neighbour
+            x0 = min(group_x) - 1
+            y0 = min(group_y) - 1
+            width = max(group_x) + 2 - x0
+            window = tiles.get_window(x0, y0, width, max(group_y) + 2 - y0)
+            for offset, walls in _gather_walls(window, width, group_x, group_y, x0, y0).items():
+                parts[offset].append(walls)
+
+        # back from chunk order to the order of the circles
+        position = sorted(range(0, len(order)), key=order.__getitem__)
+        return {offset: bytes(map(b''.join(walls).__getitem__, position)) for offset, walls in parts.items()}
+
+    def collide_batch(self, xs, ys, radii, contacts):
+        """
+        Collide many circles against the world at once and write the same contacts collide reports
+        to an array, every step is a pass over whole arrays instead of a loop over the circles
+
+        Per circle truth values are packed into big integers holding one byte per circle, so
+        combining them is a single integer operation for the whole batch.
+        :param xs: array of the circle centres along x
+        :param ys: array of the circle centres along y
+        :param radii: array of the circle radii, a circle with a radius of 0 never touches anything
+        :param contacts: array('B') to write the CONTACT_* flags of every circle to
+        """
+        count = len(xs)
+        if not count:
+            return
+
+        ix = list(map(int, map(floordiv, xs, repeat(TILE_SIZE))))
+        iy = list(map(int, map(floordiv, ys, repeat(TILE_SIZE))))
+        wall = {offset: int.from_bytes(walls, 'little') for offset, walls in self._gather_walls(ix, iy).items()}
+
+        # squared distance from every centre to the column of tiles left and right of it,
+        # and likewise to the rows below and above it
+        tile_left = list(map(mul, ix, repeat(TILE_SIZE)))
+        tile_bottom = list(map(mul, iy, repeat(TILE_SIZE)))
+        dx = list(map(sub, xs, tile_left))
+        dy = list(map(sub, ys, tile_bottom))
+        dx_right = list(map(sub, map(add, tile_left, repeat(TILE_SIZE)), xs))
+        dy_top = list(map(sub, map(add, tile_bottom, repeat(TILE_SIZE)), ys))
+        dx2 = {-1: list(map(mul, dx, dx)), 1: list(map(mul, dx_right, dx_right))}
+        dy2 = {-1: list(map(mul, dy, dy)), 1: list(map(mul, dy_top, dy_top))}
+        radius2 = list(map(mul, radii, radii))
+
+        def hits(ox, oy):
+            distance2 = dx2[ox] if not oy else dy2[oy] if not ox else map(add, dx2[ox], dy2[oy])
+            return wall[(ox, oy)] & _pack(map(lt, distance2, radius2))
+
+        # a touched wall only counts for a side if the tile between it and the centre is open,
+        # and a centre exactly on the edge of its tile is not past the wall on the other side
+        ones = _pack(repeat(1, count))
+        left = right = bottom = top = 0
+        for offset in (-1, 0, 1):
+            open_x = ones ^ wall[(0, offset)]
+            open_y = ones ^ wall[(offset, 0)]
+            left |= hits(1, offset) & open_x
+            right |= hits(-1, offset) & open_x
+            bottom |= hits(offset, 1) & open_y
+            top |= hits(offset, -1) & open_y
+        right &= _pack(map(gt, xs, tile_left))
+        top &= _pack(map(gt, ys, tile_bottom))
+
+        # every byte is 0 or 1, so scaling by a flag sets that flag in the byte without carrying over
+        flags = left * CONTACT_LEFT | right * CONTACT_RIGHT | bottom * CONTACT_BOTTOM | top * CONTACT_TOP
+        contacts[:] = array('B', flags.to_bytes(count, 'little'))
+
+
+def _gather_walls(data, width, ix, iy, x0, y0):
+    """
+    :param data: flat tiles, width tiles per row, the first one at x0, y0
+    :return: dict of x, y offset -> bytes holding a 1 for every circle whose tile at that offset is a wall
+    """
+    # index of the tile every circle is in, its neighbours are a constant offset away
+    base = list(map(add, map(mul, map(sub, iy, repeat(y0)), repeat(width)), map(sub, ix, repeat(x0))))
+    return {
+        (ox, oy): bytes(map(data.__getitem__, map(add, base, repeat(oy * width + ox)))).translate(_WALL_MASK)
+        for ox, oy in _OFFSETS
+    }
+
+
+def _pack(values):
+    """
+    :param values: iterable of 0, 1 or bools
+    :return: int holding the values as one byte each, the first value in the lowest byte
+    """
+    return int.from_bytes(bytes(values), 'little')
+
+
+class SpatialHash:
+    """
+    Uniform grid hashing shapes by the cells their bounds cover
+
+    Shapes update their cells themselves whenever their position changes, so finding candidate pairs
+    only costs as much as the number of shapes sharing a cell.
+    """
+
+    def __init__(self, cell_size):
+        self._cell_size = cell_size
+        self._cells = {}
+        self._shape_cells = {}
+
+    def _cell_range(self, shape):
+        left, bottom, right, top = shape.get_bounds()
+        size = self._cell_size
+        return int(left // size), int(bottom // size), int(right // size), int(top // size)
+
+    def update(self, shape):
+        cell_range = self._cell_range(shape)
+        old_range = self._shape_cells.get(shape)
+        if cell_range == old_range:
+            return
+
+        if old_range:
+            self._remove_cells(shape, old_range)
+        self._shape_cells[shape] = cell_range
+
+        x0, y0, x1, y1 = cell_range
+        for cy in range(y0, y1 + 1):
+            for cx in range(x0, x1 + 1):
+                self._cells.setdefault((cx, cy), []).append(shape)
+
+    def remove(self, shape):
+        old_range = self._shape_cells.pop(shape, None)
+        if old_range:
+            self._remove_cells(shape, old_range)
+
+    def _remove_cells(self, shape, cell_range):
+        x0, y0, x1, y1 = cell_range
+        for cy in range(y0, y1 + 1):
+            for cx in range(x0, x1 + 1):
+                cell = self._cells[(cx, cy)]
+                cell.remove(shape)
+                if not cell:
+                    del self._cells[(cx, cy)]
+
+    def pairs(self):
+        """
+        Yield every pair of shapes sharing at least one cell, once
+        """
+        seen = set()
+        for cell in self._cells.values():
+            if len(cell) < 2:
+                continue
+            for i in range(0, len(cell) - 1):
+                a = cell[i]
+                for b in cell[i + 1:]:
+                    key = (id(a), id(b)) if id(a) < id(b) else (id(b), id(a))
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    yield a, b
+
+
+def _circle_rectangle_collide(circle, rectangle):
+    nx = max(rectangle.x, min(circle.x, rectangle.x + rectangle.width))
+    ny = max(rectangle.y, min(circle.y, rectangle.y + rectangle.height))
+    dx = circle.x - nx
+    dy = circle.y - ny
+    return dx * dx + dy * dy < circle.radius * circle.radius
+
+
+def shapes_collide(a, b):
+    """
+    Narrow phase test between two shapes
+    :return: True if the shapes overlap
+    """
+    if isinstance(a, Circle) and isinstance(b, Circle):
+        dx = a.x - b.x
+        dy = a.y - b.y
+        radius = a.radius + b.radius
+        return dx * dx + dy * dy < radius * radius
+    if isinstance(a, Circle):
+        return _circle_rectangle_collide(a, b)
+    if isinstance(b, Circle):
+        return _circle_rectangle_collide(b, a)
+    return (
+        a.x < b.x + b.width and
+        a.x + a.width > b.x and
+        a.y < b.y + b.height and
+        a.y + a.height > b.y
+    )
+
 
 class PhysicsShape:
 
-    x = 0
-    y = 0
-    _callback = None
+    __slots__ = ('_x', '_y', '_callback', '_spatial_hash')
+
+    def __init__(self):
+        self._x = 0
+        self._y = 0
+        self._callback = None
+        self._spatial_hash = None
+
+    @property
+    def x(self):
+        return self._x
+
+    @x.setter
+    def x(self, value):
+        self._x = value
+        if self._spatial_hash:
+            self._spatial_hash.update(self)
+
+    @property
+    def y(self):
+        return self._y
+
+    @y.setter
+    def y(self, value):
+        self._y = value
+        if self._spatial_hash:
+            self._spatial_hash.update(self)
+
+    def set_position(self, x, y):
+        """
+        Move both axes at once, updating the spatial hash only once
+        """
+        self._x = x
+        self._y = y
+        if self._spatial_hash:
+            self._spatial_hash.update(self)
+
+    def set_spatial_hash(self, spatial_hash):
+        self._spatial_hash = spatial_hash
+        spatial_hash.update(self)
+
+    def get_bounds(self):
+        """
+        :return: left, bottom, right and top edge of the shape
+        """
+        raise NotImplementedError()
 
     def set_callback(self, func):
         self._callback = func
 
+    def has_callback(self):
+        return self._callback is not None
+
     def callback(self, **kwargs):
         if self._callback:
             self._callback(**kwargs)
 
-    def debug_draw(self):
-        raise NotImplementedError()
-
 
 class Rectangle(PhysicsShape):
 
-    def __init__(self):
-        pass
+    __slots__ = ('width', 'height')
 
-    def debug_draw(self):
-        pass
+    def __init__(self, width, height):
+        super().__init__()
+        self.width = width
+        self.height = height
+
+    def get_bounds(self):
+        return self._x, self._y, self._x + self.width, self._y + self.height
 
 
 class Circle(PhysicsShape):
 
+    __slots__ = ('radius',)
+
     def __init__(self, radius):
+        super().__init__()
         self.radius = radius
 
-    def debug_draw(self):
-        vertices = []
-        for i in range(0, 20):
-            theta = 2.0 * math.pi * i / 20
-            x = self.x + (self.radius * math.cos(theta))
-            y = self.y + (self.radius * math.sin(theta))
-
-            vertices.append(x)
-            vertices.append(y)
-
-        pyglet.graphics.draw(
-            int(len(vertices) / 2),
-            pyglet.gl.GL_TRIANGLE_FAN,
-            ('v2f', tuple(vertices)),
-            ('c4B', (100, 100, 255, 150) * int(len(vertices) / 2))
-        )
+    def get_bounds(self):
+        return self._x - self.radius, self._y - self.radius, self._x + self.radius, self._y + self.radius
@@ -0,0 +1,155 @@
+import csv
+import json
+import time
+import logging
+import pyglet
+from array import array
+
+PROFILER_SAMPLES = 300
+OVERLAY_REFRESH = 0.25
+
+
+class RingBuffer:
+    """
+    Fixed size buffer of floats overwriting its oldest value once full
+    """
+
+    def __init__(self, capacity):
+        self._values = array('d', [0.0]) * capacity
+        self._index = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, value):
+        self._values[self._index] = value
+        self._index = (self._index + 1) % len(self._values)
+        self._count = min(self._count + 1, len(self._values))
+
+    def percentiles(self, *percentiles):
+        ordered = sorted(self._values[:self._count])
+        return [ordered[min(int(self._count * p / 100.0), self._count - 1)] for p in percentiles]
+
+
+class _Section:
+
+    __slots__ = ('_profiler', '_name', '_start')
+
+    def __init__(self, profiler, name):
+        self._profiler = profiler
+        self._name = name
+        self._start = 0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._profiler.add(self._name, time.perf_counter() - self._start)
+
+
+class Profiler:
+    """
+    Times named sections of every frame and keeps the recent history of each one
+
+    Time spent in a section is summed over a frame, end_frame pushes the sums into a ring buffer per
+    section and optionally appends them to a trace file. A .json trace holds one JSON object per
+    frame, any other extension gets CSV rows of frame, section and seconds.
+    """
+
+    def __init__(self, capacity=PROFILER_SAMPLES, trace_path=None):
+        self._capacity = capacity
+        self._history = {}
+        self._frame = {}
+        self._frame_number = 0
+        self._sections = {}
+
+        self._trace = None
+        self._trace_writer = None
+        if trace_path:
+            logging.info('Writing profiler trace to {0}'.format(trace_path))
+            self._trace = open(trace_path, 'w', newline='')
+            if not trace_path.endswith('.json'):
+                self._trace_writer = csv.writer(self._trace)
+                self._trace_writer.writerow(('frame', 'section', 'seconds'))
+
+    def section(self, name):
+        """
+        Context manager timing the code it wraps as part of the named section
+        """
+        section = self._sections.get(name)
+        if not section:
+            section = self._sections[name] = _Section(self, name)
+        return section
+
+    def add(self, name, seconds):
+        self._frame[name] = self._frame.get(name, 0.0) + seconds
+
+    def end_frame(self):
+        for name, seconds in self._frame.items():
+            history = self._history.get(name)
+            if not history:
+                history = self._history[name] = RingBuffer(self._capacity)
+            history.append(seconds)
+
+        if self._trace_writer:
+            self._trace_writer.writerows((self._frame_number, name, seconds) for name, seconds in self._frame.items())
+        elif self._trace:
+            self._trace.write(json.dumps({'frame': self._frame_number, 'sections': self._frame}) + '\n')
+
+        self._frame = {}
+        self._frame_number += 1
+
+    def get_percentiles(self):
+        """
+        :return: dict of section name -> (p50, p95, p99) in seconds over the recorded frames
+        """
+        return {name: history.percentiles(50, 95, 99) for name, history in self._history.items()}
+
+    def close(self):
+        if self._trace:
+            self._trace.close()
+            self._trace = None
+            self._trace_writer = None
+
+
+class ProfilerOverlay:
+    """
+    On-screen table of the rolling section percentiles of a profiler
+    """
+
+    visible = False
+
+    def __init__(self, profiler):
+        self._profiler = profiler
+        self._label = None
+        self._last_refresh = 0
+
+    def toggle(self):
+        self.visible = not self.visible
+
+    def _refresh(self):
+        lines = ['{0:<24}{1:>8}{2:>8}{3:>8}'.format('ms', 'p50', 'p95', 'p99')]
+        for name, values in sorted(self._profiler.get_percentiles().items()):
+            lines.append('{0:<24}{1:>8.2f}{2:>8.2f}{3:>8.2f}'.format(name, *(value * 1000 for value in values)))
+        text = '\n'.join(lines)
+
+        if not self._label:
+            self._label = pyglet.text.Label(
+                text, font_name='Courier New', font_size=10, x=10, y=-10, anchor_y='top',
+                multiline=True, width=400
+            )
+        else:
+            self._label.text = text
+
+    def draw(self, window):
+        if not self.visible:
+            return
+
+        now = time.perf_counter()
+        if not self._label or now - self._last_refresh > OVERLAY_REFRESH:
+            self._refresh()
+            self._last_refresh = now
+
+        self._label.y = window.height - 10
+        self._label.draw()
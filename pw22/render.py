@@ -0,0 +1,364 @@
+import math
+import logging
+import pyglet
+from itertools import cycle, repeat
+from operator import add, mul
+
+from .assets import registry
+from .world import TILE_SIZE, TILE_FLOOR, TILE_WALL
+
+# width and height of a render chunk in tiles
+CHUNK_SIZE = 16
+
+TILE_IMAGES = {
+    TILE_FLOOR: 'rock_floor.png',
+    TILE_WALL: 'wall.gif'
+}
+
+# alpha of the shade over tiles that were seen before but are not in view, and over unseen tiles
+DARKNESS_EXPLORED = 160
+DARKNESS_UNEXPLORED = 255
+
+# segments of the circle outlines drawn by PhysicsDebugRenderer
+CIRCLE_SEGMENTS = 20
+DEBUG_COLOR = (100, 100, 255, 150)
+
+_tile_atlas = None
+_tile_regions = None
+
+
+def _chunk_range(x, y, width, height, columns):
+    """
+    :return: cx0, cy0, cx1, cy1 of the inclusive range of chunks of a square map intersecting a camera rectangle
+    """
+    chunk_pixels = CHUNK_SIZE * TILE_SIZE
+    return (
+        max(int(x // chunk_pixels), 0),
+        max(int(y // chunk_pixels), 0),
+        min(int((x + width) // chunk_pixels), columns - 1),
+        min(int((y + height) // chunk_pixels), columns - 1)
+    )
+
+
+def _circle_template(segments):
+    """
+    Triangles of a unit circle around the origin, as flat x, y pairs
+    """
+    points = [
+        (math.cos(2.0 * math.pi * i / segments), math.sin(2.0 * math.pi * i / segments))
+        for i in range(0, segments + 1)
+    ]
+    template = []
+    for i in range(0, segments):
+        template.extend((0.0, 0.0) + points[i] + points[i + 1])
+    return template
+
+
+_CIRCLE_TEMPLATE = _circle_template(CIRCLE_SEGMENTS)
+
+
+def _load_tile_atlas():
+    """
+    Pack every tile image into one texture so a whole chunk draws with a single bind, a baked asset
+    pack already is one texture shared with the sprites and is used as it is
+    :return: the atlas texture and a dict of tile -> texture region
+    """
+    global _tile_atlas, _tile_regions
+    if not _tile_atlas:
+        pack = registry.get_pack()
+        if pack and all(name in pack for name in TILE_IMAGES.values()):
+            logging.debug('Using tile regions of the asset pack')
+            _tile_atlas = pack.get_texture()
+            _tile_regions = {tile: registry.image(name) for tile, name in TILE_IMAGES.items()}
+        else:
+            logging.debug('Creating tile atlas')
+            atlas = pyglet.image.atlas.TextureAtlas(512, 512)
+            _tile_regions = {}
+            for tile, name in TILE_IMAGES.items():
+                _tile_regions[tile] = atlas.add(registry.image(name).get_image_data())
+            _tile_atlas = atlas.texture
+    return _tile_atlas, _tile_regions
+
+
+class TileRenderer:
+    """
+    Draws the tiles of a world as static vertex lists, one per chunk of CHUNK_SIZE x CHUNK_SIZE tiles
+
+    Only chunks intersecting the camera rectangle are drawn, so the cost of a frame depends on the
+    window size and not on the world size. Chunks are uploaded with upload, which can be spread over
+    several frames, chunks that are not uploaded yet are skipped when drawing.
+    """
+
+    def __init__(self, world):
+        self._world = world
+        self._chunks = {}  # (cx, cy) -> vertex list, None for chunks without tiles
+
+        texture, self._regions = _load_tile_atlas()
+        self._group = pyglet.graphics.TextureGroup(texture)
+        self._pending = self._initial_chunks()
+
+    def _initial_chunks(self):
+        """
+        :return: chunks waiting for upload, sorted so the ones nearest the spawn point pop first
+        """
+        self._columns = (self._world.get_size() + CHUNK_SIZE - 1) // CHUNK_SIZE
+        chunk_pixels = CHUNK_SIZE * TILE_SIZE
+        spawn_x = (self._world.get_spawn_x() or 0) // chunk_pixels
+        spawn_y = (self._world.get_spawn_y() or 0) // chunk_pixels
+        return sorted(
+            ((cx, cy) for cy in range(0, self._columns) for cx in range(0, self._columns)),
+            key=lambda key: abs(key[0] - spawn_x) + abs(key[1] - spawn_y),
+            reverse=True
+        )
+
+    def is_uploaded(self):
+        return not self._pending
+
+    def upload(self, max_chunks=None):
+        """
+        Build vertex lists for chunks that have not been uploaded yet
+        :param max_chunks: upper limit of chunks to upload in this call, None uploads all of them
+        """
+        count = 0
+        while self._pending and (max_chunks is None or count < max_chunks):
+            self._create_chunk(*self._pending.pop())
+            count += 1
+
+        if count and not self._pending:
+            logging.debug('Uploaded {0} tile chunks'.format(len(self._chunks)))
+
+    def _create_chunk(self, cx, cy):
+        vertices = []
+        tex_coords = []
+        tiles = self._world.get_tiles()
+        for x, y, tile in tiles.non_empty(cx * CHUNK_SIZE, cy * CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE):
+            x0 = x * TILE_SIZE
+            y0 = y * TILE_SIZE
+            x1 = x0 + TILE_SIZE
+            y1 = y0 + TILE_SIZE
+            vertices.extend((x0, y0, x1, y0, x1, y1, x0, y1))
+            tex_coords.extend(self._regions[tile].tex_coords)
+
+        # chunks without any tiles are uploaded as nothing
+        self._chunks[(cx, cy)] = None
+        if vertices:
+            self._chunks[(cx, cy)] = pyglet.graphics.vertex_list(
+                len(vertices) // 2,
+                ('v2i/static', vertices),
+                ('t3f/static', tex_coords)
+            )
+
+    def _delete_chunk(self, key):
+        vertex_list = self._chunks.pop(key)
+        if vertex_list:
+            vertex_list.delete()
+
+    def delete(self):
+        for key in list(self._chunks):
+            self._delete_chunk(key)
+        self._pending = []
+
+    def _visible_chunks(self, x, y, width, height):
+        """
+        :return: cx0, cy0, cx1, cy1 of the inclusive range of chunks intersecting a camera rectangle
+        """
+        return _chunk_range(x, y, width, height, self._columns)
+
+    def draw(self, x, y, width, height):
+        """
+        Draw the chunks intersecting a camera rectangle
+        :param x: left edge of the camera in world pixels
+        :param y: bottom edge of the camera in world pixels
+        :param width: width of the camera in pixels
+        :param height: height of the camera in pixels
+        """
+        cx0, cy0, cx1, cy1 = self._visible_chunks(x, y, width, height)
+
+        self._group.set_state()
+        for cy in range(cy0, cy1 + 1):
+            for cx in range(cx0, cx1 + 1):
+                vertex_list = self._chunks.get((cx, cy))
+                if vertex_list:
+                    vertex_list.draw(pyglet.gl.GL_QUADS)
+        self._group.unset_state()
+
+
+class StreamingTileRenderer(TileRenderer):
+    """
+    Draws the tiles of a ChunkedWorld around the camera
+
+    Chunks are queued for upload as they come into view and deleted again once they are more than
+    STREAM_MARGIN chunks out of it, so the number of vertex lists stays bounded however far the
+    camera moves.
+    """
+
+    # chunks kept around the camera before their vertex lists are deleted
+    STREAM_MARGIN = 2
+
+    def _initial_chunks(self):
+        return []
+
+    def _visible_chunks(self, x, y, width, height):
+        chunk_pixels = CHUNK_SIZE * TILE_SIZE
+        return (
+            int(x // chunk_pixels),
+            int(y // chunk_pixels),
+            int((x + width) // chunk_pixels),
+            int((y + height) // chunk_pixels)
+        )
+
+    def draw(self, x, y, width, height):
+        cx0, cy0, cx1, cy1 = self._visible_chunks(x, y, width, height)
+
+        margin = self.STREAM_MARGIN
+        for key in list(self._chunks):
+            if not (cx0 - margin <= key[0] <= cx1 + margin and cy0 - margin <= key[1] <= cy1 + margin):
+                self._delete_chunk(key)
+
+        # visible chunks are queued nearest the camera centre last, so they are uploaded first
+        center_x = (cx0 + cx1) / 2.0
+        center_y = (cy0 + cy1) / 2.0
+        self._pending = sorted(
+            (
+                (cx, cy) for cy in range(cy0, cy1 + 1) for cx in range(cx0, cx1 + 1)
+                if (cx, cy) not in self._chunks
+            ),
+            key=lambda key: abs(key[0] - center_x) + abs(key[1] - center_y),
+            reverse=True
+        )
+
+        super().draw(x, y, width, height)
+
+
+class DarknessLayer:
+    """
+    Shades the tiles of a world by what the viewer of a Visibility sees, one vertex list per chunk
+
+    Tiles in view are left clear, explored tiles are dimmed and everything else is black. The
+    colours of a chunk are only rewritten after a recompute of the field of view touched it, and
+    not before the chunk is drawn again.
+    """
+
+    def __init__(self, visibility, size):
+        """
+        :param size: width and height of the world in tiles
+        """
+        self._visibility = visibility
+        self._size = size
+        self._columns = (size + CHUNK_SIZE - 1) // CHUNK_SIZE
+        self._chunks = {}
+        self._dirty = set()
+        visibility.add_listener(self._changed)
+
+    def _changed(self, x0, y0, x1, y1):
+        for cy in range(y0 // CHUNK_SIZE, y1 // CHUNK_SIZE + 1):
+            for cx in range(x0 // CHUNK_SIZE, x1 // CHUNK_SIZE + 1):
+                self._dirty.add((cx, cy))
+
+    def _tile_range(self, cx, cy):
+        return (
+            cx * CHUNK_SIZE, cy * CHUNK_SIZE,
+            min((cx + 1) * CHUNK_SIZE, self._size), min((cy + 1) * CHUNK_SIZE, self._size)
+        )
+
+    def _create_chunk(self, cx, cy):
+        x0, y0, x1, y1 = self._tile_range(cx, cy)
+        vertices = []
+        for y in range(y0, y1):
+            for x in range(x0, x1):
+                left = x * TILE_SIZE
+                bottom = y * TILE_SIZE
+                vertices.extend((
+                    left, bottom, left + TILE_SIZE, bottom,
+                    left + TILE_SIZE, bottom + TILE_SIZE, left, bottom + TILE_SIZE
+                ))
+        return pyglet.graphics.vertex_list(len(vertices) // 2, ('v2i/static', vertices), 'c4B/dynamic')
+
+    def _update_chunk(self, vertex_list, cx, cy):
+        x0, y0, x1, y1 = self._tile_range(cx, cy)
+        visible = self._visibility.visible
+        explored = self._visibility.explored
+        size = self._size
+        colors = []
+        for y in range(y0, y1):
+            for index in range(y * size + x0, y * size + x1):
+                bit = 1 << (index & 7)
+                if visible[index >> 3] & bit:
+                    alpha = 0
+                elif explored[index >> 3] & bit:
+                    alpha = DARKNESS_EXPLORED
+                else:
+                    alpha = DARKNESS_UNEXPLORED
+                colors.extend((0, 0, 0, alpha) * 4)
+        vertex_list.colors[:] = colors
+
+    def draw(self, x, y, width, height):
+        """
+        Draw the shade over the chunks intersecting a camera rectangle
+        """
+        cx0, cy0, cx1, cy1 = _chunk_range(x, y, width, height, self._columns)
+        for cy in range(cy0, cy1 + 1):
+            for cx in range(cx0, cx1 + 1):
+                key = (cx, cy)
+                vertex_list = self._chunks.get(key)
+                if not vertex_list:
+                    vertex_list = self._chunks[key] = self._create_chunk(cx, cy)
+                    self._dirty.add(key)
+                if key in self._dirty:
+                    self._update_chunk(vertex_list, cx, cy)
+                    self._dirty.discard(key)
+                vertex_list.draw(pyglet.gl.GL_QUADS)
+
+    def delete(self):
+        for vertex_list in self._chunks.values():
+            vertex_list.delete()
+        self._chunks = {}
+
+
+class PhysicsDebugRenderer:
+    """
+    Draws the circles of a physics simulation as one vertex list of triangles
+
+    The vertex list is kept between frames and only its positions are rewritten, each circle is
+    the unit circle template scaled by its radius and moved to its centre. Nothing is updated or
+    drawn while the renderer is hidden.
+    """
+
+    visible = False
+
+    def __init__(self, simulation):
+        self._simulation = simulation
+        self._vertex_list = None
+
+    def toggle(self):
+        self.visible = not self.visible
+
+    def _update(self, circles):
+        count = len(circles) * len(_CIRCLE_TEMPLATE) // 2
+        if not count:
+            return False
+
+        if not self._vertex_list:
+            self._vertex_list = pyglet.graphics.vertex_list(count, 'v2f/stream', 'c4B/static')
+            self._vertex_list.colors[:] = DEBUG_COLOR * count
+        elif self._vertex_list.get_size() != count:
+            self._vertex_list.resize(count)
+            self._vertex_list.colors[:] = DEBUG_COLOR * count
+
+        vertices = []
+        for circle in circles:
+            vertices.extend(map(add, map(mul, _CIRCLE_TEMPLATE, repeat(circle.radius)), cycle((circle.x, circle.y))))
+        self._vertex_list.vertices[:] = vertices
+        return True
+
+    def draw(self):
+        if not self.visible:
+            return
+
+        if self._update(self._simulation.get_circles()):
+            self._vertex_list.draw(pyglet.gl.GL_TRIANGLES)
+
+    def delete(self):
+        if self._vertex_list:
+            self._vertex_list.delete()
+            self._vertex_list = None
@@ -0,0 +1,185 @@
+"""
+Replay a recorded play session headlessly and time every simulation tick
+
+Record a session by setting PW22_RECORD to a file path when starting the game, then run
+python -m pw22.replay <file>. The replay opens no window and never draws, so only the update path
+is measured.
+"""
+import sys
+import json
+import time
+import struct
+import logging
+import argparse
+
+import pyglet
+
+from .world import WORLD_SIZE
+from .scenes import SceneManager, GameScene
+from .profiler import Profiler
+from .bench import summarize
+
+REPLAY_MAGIC = b'PW2R'
+# bump whenever the layout of the log changes
+REPLAY_VERSION = 1
+
+# magic, version, world seed, world size (0 for a streaming world), streaming flag
+REPLAY_HEADER = struct.Struct('<4sHIHB')
+
+EVENT_TICK = 0
+EVENT_KEY_PRESS = 1
+EVENT_KEY_RELEASE = 2
+EVENT_MOUSE_MOTION = 3
+EVENT_MOUSE_RELEASE = 4
+
+# every event is a type byte followed by its arguments
+EVENT_TYPE = struct.Struct('<B')
+EVENT_ARGUMENTS = {
+    EVENT_TICK: struct.Struct('<d'),  # dt
+    EVENT_KEY_PRESS: struct.Struct('<Ii'),  # symbol, modifiers
+    EVENT_KEY_RELEASE: struct.Struct('<Ii'),  # symbol, modifiers
+    EVENT_MOUSE_MOTION: struct.Struct('<4i'),  # x, y, dx, dy
+    EVENT_MOUSE_RELEASE: struct.Struct('<4i')  # x, y, button, modifiers
+}
+
+# slowest ticks listed in the report
+REPLAY_SLOWEST = 10
+
+
+class InputRecorder:
+    """
+    Writes the seed of the world, every input event and every simulation tick of a session to a log
+
+    Hand it to SceneManager.set_recorder, the manager reports events in the order its scene gets them.
+    """
+
+    def __init__(self, path, seed, size=WORLD_SIZE, streaming=False):
+        """
+        :param seed: seed of the world being played
+        :param size: size of the world being played, ignored for a streaming world
+        :param streaming: True if the world is a ChunkedWorld
+        """
+        logging.info('Recording input to {0}'.format(path))
+        self._file = open(path, 'wb')
+        self._file.write(REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, seed, 0 if streaming else size, streaming))
+
+    def _write(self, event, *arguments):
+        self._file.write(EVENT_TYPE.pack(event) + EVENT_ARGUMENTS[event].pack(*arguments))
+
+    def tick(self, dt):
+        self._write(EVENT_TICK, dt)
+
+    def key_press(self, symbol, modifiers):
+        self._write(EVENT_KEY_PRESS, symbol, modifiers)
+
+    def key_release(self, symbol, modifiers):
+        self._write(EVENT_KEY_RELEASE, symbol, modifiers)
+
+    def mouse_motion(self, x, y, dx, dy):
+        self._write(EVENT_MOUSE_MOTION, x, y, dx, dy)
+
+    def mouse_release(self, x, y, button, modifiers):
+        self._write(EVENT_MOUSE_RELEASE, x, y, button, modifiers)
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+def read_log(path):
+    """
+    :return: dict of the header fields and a list of (event, arguments) in recorded order
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    magic, version, seed, size, streaming = REPLAY_HEADER.unpack_from(data)
+    if magic != REPLAY_MAGIC:
+        raise ValueError('Not a replay log: {0}'.format(path))
+    if version != REPLAY_VERSION:
+        raise ValueError('Replay log version {0} is not supported: {1}'.format(version, path))
+
+    events = []
+    offset = REPLAY_HEADER.size
+    while offset < len(data):
+        event, = EVENT_TYPE.unpack_from(data, offset)
+        arguments = EVENT_ARGUMENTS[event]
+        events.append((event, arguments.unpack_from(data, offset + EVENT_TYPE.size)))
+        offset += EVENT_TYPE.size + arguments.size
+
+    header = {'seed': seed, 'size': size or WORLD_SIZE, 'streaming': bool(streaming)}
+    return header, events
+
+
+def replay(header, events, profiler=None, scene_manager=None):
+    """
+    Feed a recorded session through a headless SceneManager as fast as possible
+    :param header: header of the log as returned by read_log
+    :param events: events of the log as returned by read_log
+    :param profiler: optional Profiler to time the sections of every tick with, ends a frame per tick,
+    ignored if scene_manager is given, its profiler is used instead
+    :param scene_manager: optional SceneManager without a window to replay into, to look at the scene afterwards
+    :return: list of the seconds every tick took
+    """
+    # scenes read key symbols from pyglet.window, which opens a hidden window on import unless told not to
+    pyglet.options['shadow_window'] = False
+
+    scene_manager = scene_manager or SceneManager(None, profiler or Profiler())
+    profiler = scene_manager.profiler
+    logging.info('Replaying {0} events on world {1}'.format(len(events), header['seed']))
+    scene_manager.push(GameScene(scene_manager, streaming=header['streaming'], seed=header['seed'], size=header['size']))
+
+    handlers = {
+        EVENT_KEY_PRESS: scene_manager.on_key_press,
+        EVENT_KEY_RELEASE: scene_manager.on_key_release,
+        EVENT_MOUSE_MOTION: scene_manager.on_mouse_motion,
+        EVENT_MOUSE_RELEASE: scene_manager.on_mouse_release
+    }
+
+    timings = []
+    for event, arguments in events:
+        if event != EVENT_TICK:
+            handlers[event](*arguments)
+            continue
+
+        start = time.perf_counter()
+        scene_manager.on_update(*arguments)
+        timings.append(time.perf_counter() - start)
+        profiler.end_frame()
+
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pw22.replay', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('log', help='file recorded with PW22_RECORD')
+    parser.add_argument('--trace', help='.csv or .json file to write the section times of every tick to')
+    parser.add_argument('--output', help='file to write the JSON results to, stdout if omitted')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(asctime)s %(module)s %(levelname)s %(message)s', level=logging.INFO)
+    header, events = read_log(args.log)
+    # room for the section times of every tick, so the percentiles cover the whole session
+    ticks = sum(1 for event, arguments in events if event == EVENT_TICK)
+    profiler = Profiler(capacity=max(ticks, 1), trace_path=args.trace)
+    timings = replay(header, events, profiler)
+    profiler.close()
+
+    slowest = sorted(range(0, len(timings)), key=lambda tick: timings[tick], reverse=True)[:REPLAY_SLOWEST]
+    results = {
+        'ticks': summarize(timings) if timings else None,
+        'slowest': [{'tick': tick, 'seconds': timings[tick]} for tick in slowest],
+        'sections': {name: dict(zip(('p50', 'p95', 'p99'), values)) for name, values in profiler.get_percentiles().items()}
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
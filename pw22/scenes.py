@@ -1,48 +1,103 @@
+import zlib
 import pyglet
 import logging
 
-from .world import World
-from .physics import PhysicsSimulation
-from .actors import Player
+from .world import World, WORLD_SIZE, TILE_SIZE
+from .render import TileRenderer, StreamingTileRenderer, DarknessLayer, PhysicsDebugRenderer
+from .physics import PhysicsSimulation, Circle
+from .actors import Actor, ActorStore, Player
+from .profiler import Profiler
+from .navigation import FlowField, HierarchicalPathfinder
+from .streaming import ChunkedWorld
+from .visibility import Visibility
 
 
 class SceneManager:
+    """
+    Stack of scenes, input and updates go to the scene on top
 
-    _scenes = []
+    The manager handles the input events of the window itself and passes them on, so an optional
+    InputRecorder sees every event and every update in the order the scene got them.
+    """
 
-    def __init__(self, window):
+    def __init__(self, window, profiler=None):
+        """
+        :param window: window to take input from, None to run headless and feed events by hand
+        """
         logging.info('Initializing SceneManager')
         self.window = window
-
-    def push(self, scene):
+        self._scenes = []
+        self._recorder = None
+        self.profiler = profiler or Profiler()
+        if window:
+            window.push_handlers(
+                self.on_key_press,
+                self.on_key_release,
+                self.on_mouse_motion,
+                self.on_mouse_release
+            )
+
+    def push(self, scene, compact=False):
+        """
+        Put a scene on top, the scene it covers is suspended until it is on top again
+        :param compact: let the covered scene serialise its heavy state while it is suspended
+        """
         logging.info('Pushing scene: {}'.format(scene))
-        try:
-            self.window.pop_handlers()
-        except AssertionError:
-            pass
-
-        self._push_handlers(scene)
+        if self._scenes:
+            self._scenes[-1].on_suspend(compact)
         self._scenes.append(scene)
 
     def pop(self):
-        self.window.pop_handlers()
-        self._scenes.pop()
+        """
+        Remove the scene on top and resume the one under it, the removed scene is suspended first so
+        it lets go of its GL resources
+        :return: the removed scene
+        """
+        scene = self._scenes.pop()
+        logging.info('Popping scene: {}'.format(scene))
+        scene.on_suspend()
+        if self._scenes:
+            self._scenes[-1].on_resume()
+        return scene
+
+    def get_scene(self):
+        """
+        :return: the scene on top, None if there is none
+        """
+        return self._scenes[-1] if self._scenes else None
+
+    def set_recorder(self, recorder):
+        self._recorder = recorder
+
+    def on_draw(self, alpha):
+        with self.profiler.section('draw'):
+            self._scenes[-1].on_draw(alpha)
 
-        self._push_handlers(self._scenes[-1])
+    def on_update(self, dt):
+        if self._recorder:
+            self._recorder.tick(dt)
+        with self.profiler.section('update'):
+            self._scenes[-1].on_update(dt)
+
+    def on_key_press(self, symbol, modifiers):
+        if self._recorder:
+            self._recorder.key_press(symbol, modifiers)
+        self._scenes[-1].on_key_press(symbol, modifiers)
 
-    def _push_handlers(self, scene):
-        self.window.push_handlers(
-            scene.on_key_press,
-            scene.on_key_release,
-            scene.on_mouse_motion,
-            scene.on_mouse_release
-        )
+    def on_key_release(self, symbol, modifiers):
+        if self._recorder:
+            self._recorder.key_release(symbol, modifiers)
+        self._scenes[-1].on_key_release(symbol, modifiers)
 
-    def on_draw(self):
-        self._scenes[-1].on_draw()
+    def on_mouse_motion(self, x, y, dx, dy):
+        if self._recorder:
+            self._recorder.mouse_motion(x, y, dx, dy)
+        self._scenes[-1].on_mouse_motion(x, y, dx, dy)
 
-    def on_update(self, dt):
-        self._scenes[-1].on_update(dt)
+    def on_mouse_release(self, x, y, button, modifiers):
+        if self._recorder:
+            self._recorder.mouse_release(x, y, button, modifiers)
+        self._scenes[-1].on_mouse_release(x, y, button, modifiers)
 
 
 class Scene:
@@ -57,7 +112,23 @@ class Scene:
     def on_init(self):
         raise NotImplementedError()
 
-    def on_draw(self):
+    def on_suspend(self, compact=False):
+        """
+        Called when the scene stops being on top, it should release what it can create again
+        :param compact: also serialise heavy state to a compact form, at the cost of a slower resume
+        """
+        pass
+
+    def on_resume(self):
+        """
+        Called when the scene is on top again after the scene above it was popped
+        """
+        pass
+
+    def on_draw(self, alpha):
+        """
+        :param alpha: fraction of a simulation step elapsed since the last update, for interpolation
+        """
         raise NotImplementedError()
 
     def on_update(self, dt):
@@ -82,49 +153,250 @@ class MenuScene(Scene):
 
 class GameScene(Scene):
 
-    _actors = []
     _world = None
+    _actor_batch = None
+    _tile_renderer = None
     _physics_simulation = None
+    _physics_renderer = None
+    _flow_field = None
+    _pathfinder = None
+    _visibility = None
+    _darkness = None
     _player = None
     _camera = None
+    # compressed world snapshot and explored tiles of a compacted scene, None while it is expanded
+    _snapshot = None
+    _explored = None
+
+    # tile chunks uploaded to the GPU per frame until the whole world is uploaded
+    CHUNKS_PER_FRAME = 4
+    # steps from the player beyond which actors no longer get directions toward it
+    FLOW_FIELD_DISTANCE = 64
+
+    def __init__(self, scene_manager, world_generator=None, streaming=False, seed=None, size=WORLD_SIZE):
+        """
+        :param world_generator: optional WorldGenerator to take the world from
+        :param streaming: play an endless ChunkedWorld instead of a single generated world
+        :param seed: seed of the world to generate when there is no world generator, random if omitted
+        :param size: size of the world to generate when there is no world generator
+        """
+        self._world_generator = world_generator
+        self._streaming = streaming
+        self._seed = seed
+        self._size = size
+        self._actors = []
+        # profiler section -> actors of one class that override on_update, timed per class
+        self._steered_actors = {}
+        self._actor_store = ActorStore()
+        super().__init__(scene_manager)
 
     def on_init(self):
         logging.info('Initializing GameScene')
-        self._world = World()
-        self._world.generate()
+        if self._streaming:
+            self._world = ChunkedWorld(self._seed)
+        elif self._world_generator:
+            self._world = self._world_generator.get()
+        else:
+            self._world = World(self._size, self._seed)
+            self._world.generate()
+
+        self._physics_simulation = PhysicsSimulation()
+        self._physics_simulation.register_world(self._world)
+        self._physics_simulation.register_store(self._actor_store)
+        self._physics_renderer = PhysicsDebugRenderer(self._physics_simulation)
 
         self._player = Player()
-        self._player.x = self._world.get_spawn_x()
-        self._player.y = self._world.get_spawn_y()
-        self._actors.append(self._player)
+        self._player.set_position(self._world.get_spawn_x(), self._world.get_spawn_y())
+        self.add_actor(self._player)
+
+        # these work on a whole generated world, an endless one has none of them
+        if not self._streaming:
+            self._create_navigation()
+
+    def _create_navigation(self):
+        self._flow_field = FlowField(self._world.get_tiles(), max_distance=self.FLOW_FIELD_DISTANCE)
+        self._pathfinder = HierarchicalPathfinder(self._world)
+        self._visibility = Visibility(self._world.get_tiles())
+        self._darkness = DarknessLayer(self._visibility, self._world.get_size())
+
+    def _create_graphics(self):
+        """
+        Create what drawing needs on the first draw, a scene that is never drawn, like one
+        replayed headlessly, never touches GL
+        """
+        self._actor_batch = pyglet.graphics.Batch()
+        for actor in self._actors:
+            actor.set_batch(self._actor_batch)
 
-        self._physics_simulation = PhysicsSimulation()
+        if self._streaming:
+            self._tile_renderer = StreamingTileRenderer(self._world)
+        else:
+            self._tile_renderer = TileRenderer(self._world)
+
+    def _delete_graphics(self):
+        """
+        Release everything _create_graphics and drawing created, it is created again on the next draw
+        """
+        if not self._tile_renderer:
+            return
+
+        logging.debug('Deleting GameScene graphics')
+        for actor in self._actors:
+            actor.set_batch(None)
+        self._actor_batch = None
+        self._tile_renderer.delete()
+        self._tile_renderer = None
+        if self._darkness:
+            self._darkness.delete()
+        self._physics_renderer.delete()
+
+    def on_suspend(self, compact=False):
+        logging.info('Suspending GameScene')
+        self._delete_graphics()
+        if compact:
+            self._compact()
+
+    def on_resume(self):
+        logging.info('Resuming GameScene')
+        self._expand()
+
+    def _compact(self):
+        """
+        Serialise the world and drop everything derived from it, a streaming world pages out its chunks
+        """
+        if self._streaming:
+            self._world.evict_all()
+            return
+        if self._snapshot:
+            return
+
+        self._snapshot = zlib.compress(self._world.get_snapshot())
+        self._explored = zlib.compress(bytes(self._visibility.explored))
+        logging.debug('Compacted world {0} to {1} bytes'.format(self._world.get_seed(), len(self._snapshot)))
+        self._world = None
+        self._flow_field = None
+        self._pathfinder = None
+        self._visibility = None
+        self._darkness = None
+        self._physics_simulation.register_world(None)
+
+    def _expand(self):
+        """
+        Rebuild what _compact dropped, the flow field and the field of view are recomputed on the next update
+        """
+        if not self._snapshot:
+            return
+
+        self._world = World.from_snapshot(zlib.decompress(self._snapshot))
         self._physics_simulation.register_world(self._world)
-        self._physics_simulation.register_shape(self._player.get_shape())
+        self._create_navigation()
+        self._visibility.explored[:] = zlib.decompress(self._explored)
+        self._snapshot = None
+        self._explored = None
+
+    def on_draw(self, alpha):
+        if not self._tile_renderer:
+            self._create_graphics()
+        self._actor_store.interpolate(alpha)
 
-    def on_draw(self):
         # center view on players position
+        window = self._scene_manager.window
+        camera_x = int(self._player.get_render_x() - window.width / 2)
+        camera_y = int(self._player.get_render_y() - window.height / 2)
         pyglet.gl.glLoadIdentity()
-        pyglet.gl.glTranslatef(
-            -int(self._player.x - self._scene_manager.window.width / 2),
-            -int(self._player.y - self._scene_manager.window.height / 2),
-            -1
-        )
+        pyglet.gl.glTranslatef(-camera_x, -camera_y, -1)
 
-        self._world.on_draw()
-        for actor in self._actors:
-            actor.on_draw()
+        profiler = self._scene_manager.profiler
+        with profiler.section('draw.world'):
+            self._tile_renderer.upload(self.CHUNKS_PER_FRAME)
+            self._tile_renderer.draw(camera_x, camera_y, window.width, window.height)
+        self._actor_batch.draw()
+        if self._darkness:
+            with profiler.section('draw.darkness'):
+                self._darkness.draw(camera_x, camera_y, window.width, window.height)
 
-        self._physics_simulation.on_draw()  # only to debug physics shapes
+        self._physics_renderer.draw()  # only to debug physics shapes, toggled with F2
 
     def on_update(self, dt):
-        for actor in self._actors:
-            actor.on_update(dt)
-
-        self._physics_simulation.on_update()
+        profiler = self._scene_manager.profiler
+        for name, actors in self._steered_actors.items():
+            with profiler.section(name):
+                for actor in actors:
+                    actor.on_update(dt)
+
+        # movement of every actor is integrated in one pass over the store arrays
+        with profiler.section('update.actors'):
+            self._actor_store.update(dt)
+
+        with profiler.section('update.physics'):
+            self._physics_simulation.on_update()
+            self._actor_store.apply_contacts()
+
+        if self._streaming:
+            # only pages chunks in when the player enters another chunk
+            with profiler.section('update.world'):
+                self._world.update(self._player.x, self._player.y)
+        else:
+            # both only recomputed when the player enters another tile
+            tile_x = int(self._player.x // TILE_SIZE)
+            tile_y = int(self._player.y // TILE_SIZE)
+            with profiler.section('update.flow_field'):
+                self._flow_field.update(tile_x, tile_y)
+            with profiler.section('update.visibility'):
+                self._visibility.update(tile_x, tile_y)
+
+    def add_actor(self, actor):
+        """
+        Add an actor to the scene, its position is simulated together with every other actor
+        and its on_update is only called if its class overrides Actor.on_update. A circle with a
+        collision callback gets a call for every contact, any other circle is collided and stopped
+        in bulk with the store.
+        """
+        shape = actor.get_shape()
+        collide = isinstance(shape, Circle) and not shape.has_callback()
+        self._actors.append(actor)
+        self._actor_store.add(actor, collide)
+        if shape:
+            self._physics_simulation.register_shape(shape, collide_world=not collide)
+        if type(actor).on_update is not Actor.on_update:
+            self._steered_actors.setdefault('update.' + type(actor).__name__, []).append(actor)
+        if self._actor_batch:
+            actor.set_batch(self._actor_batch)
+
+    def get_world(self):
+        """
+        :return: World, or ChunkedWorld when streaming
+        """
+        return self._world
+
+    def get_player(self):
+        return self._player
+
+    def is_streaming(self):
+        return self._streaming
+
+    def get_flow_field(self):
+        """
+        :return: FlowField toward the tile of the player, for actors chasing it, None in a streaming world
+        """
+        return self._flow_field
+
+    def get_visibility(self):
+        """
+        :return: Visibility of the player, None in a streaming world
+        """
+        return self._visibility
+
+    def get_pathfinder(self):
+        """
+        :return: HierarchicalPathfinder for walking routes across the world, None in a streaming world
+        """
+        return self._pathfinder
 
     def on_key_press(self, symbol, modifiers):
-        if symbol == pyglet.window.key.A:
+        if symbol == pyglet.window.key.F2:
+            self._physics_renderer.toggle()
+        elif symbol == pyglet.window.key.A:
             self._player.should_move_left = -1
         elif symbol == pyglet.window.key.D:
             self._player.should_move_right = 1
@@ -0,0 +1,258 @@
+import os
+import zlib
+import random
+import logging
+from collections import OrderedDict
+
+from .astar import AStar, Grid
+from .world import (
+    World, TileMap, NON_EMPTY_TILE, GENERATOR_VERSION, SEED_LIMIT, TILE_SIZE, TILE_FLOOR, TILE_WALL, pick_seed
+)
+
+# width and height in tiles of a streamed chunk
+STREAM_CHUNK_SIZE = 64
+# chunks kept in memory, the least recently used one is evicted beyond this
+RESIDENT_CHUNKS = 25
+# chunks around the one the player is in that are generated ahead of time
+STREAM_RADIUS = 1
+# tiles kept between the gate of a chunk edge and the corners of the chunk
+GATE_MARGIN = 8
+# tiles added around the start and end of a path search to give it room to go around things
+PATH_MARGIN = 16
+
+
+def _random(seed, *key):
+    """
+    :return: random number generator seeded by the world seed and a key, the same for every run
+    """
+    return random.Random('{0}:{1}'.format(seed, ':'.join(str(part) for part in key)))
+
+
+class ChunkedWorld:
+    """
+    Endless world generated in square chunks around the player and paged in and out of memory
+
+    Every chunk is a small dungeon seeded by its coordinate, joined to its neighbours through a gate
+    on each shared edge, so chunks can be generated in any order and always come out the same.
+    Only the RESIDENT_CHUNKS most recently used chunks are kept. An evicted chunk is simply
+    regenerated the next time it is needed, unless its tiles were changed, in which case it is
+    serialised to the directory given or compressed in memory.
+
+    Tiles are addressed with global x, y coordinates, which may be negative. The world is its own
+    tile accessor: get_tiles returns it, get_tile, get_window and non_empty page chunks in as needed.
+    """
+
+    def __init__(self, seed=None, chunk_size=STREAM_CHUNK_SIZE, capacity=RESIDENT_CHUNKS, directory=None):
+        """
+        :param seed: seed for generation, a random one is picked if omitted
+        :param capacity: number of chunks kept in memory
+        :param directory: optional directory to serialise changed chunks to, kept in memory if omitted
+        """
+        self._seed = pick_seed(seed)
+        self._chunk_size = chunk_size
+        self._capacity = capacity
+        self._directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._chunks = OrderedDict()  # (cx, cy) -> TileMap, least recently used first
+        self._dirty = set()
+        self._evicted = {}  # (cx, cy) -> compressed tiles of changed chunks, without a directory
+        self._last_key = None
+        self._last_chunk = None
+        self._center = None
+
+        self._spawn_x = None
+        self._spawn_y = None
+        self.get_chunk(0, 0)
+
+    def get_seed(self):
+        return self._seed
+
+    def get_chunk_size(self):
+        return self._chunk_size
+
+    def get_tiles(self):
+        return self
+
+    def get_spawn_x(self):
+        return self._spawn_x
+
+    def get_spawn_y(self):
+        return self._spawn_y
+
+    def get_resident_chunks(self):
+        return list(self._chunks)
+
+    def get_chunk(self, cx, cy):
+        """
+        :return: TileMap of a chunk, paged in or generated if it is not resident
+        """
+        key = (cx, cy)
+        if key == self._last_key:
+            return self._last_chunk
+
+        chunk = self._chunks.get(key)
+        if chunk is None:
+            chunk = self._load_chunk(cx, cy)
+            if chunk is None:
+                chunk = self._generate_chunk(cx, cy)
+            self._chunks[key] = chunk
+            while len(self._chunks) > self._capacity:
+                self._evict()
+        else:
+            self._chunks.move_to_end(key)
+
+        self._last_key = key
+        self._last_chunk = chunk
+        return chunk
+
+    def _chunk_path(self, cx, cy):
+        return os.path.join(self._directory, '{0}-{1}-{2}-{3}-{4}.chunk'.format(
+            self._seed, self._chunk_size, GENERATOR_VERSION, cx, cy
+        ))
+
+    def _evict(self):
+        key, chunk = self._chunks.popitem(last=False)
+        if key == self._last_key:
+            self._last_key = None
+            self._last_chunk = None
+
+        # unchanged chunks are regenerated from their seed instead of stored
+        if key not in self._dirty:
+            return
+
+        logging.debug('Serialising chunk {0},{1}'.format(*key))
+        if self._directory:
+            with open(self._chunk_path(*key), 'wb') as f:
+                f.write(chunk.data)
+        else:
+            self._evicted[key] = zlib.compress(bytes(chunk.data))
+
+    def evict_all(self):
+        """
+        Page every chunk out, changed chunks are serialised like any other evicted chunk and the
+        rest are regenerated when they are needed again
+        """
+        logging.debug('Evicting {0} chunks'.format(len(self._chunks)))
+        while self._chunks:
+            self._evict()
+        self._center = None
+
+    def _load_chunk(self, cx, cy):
+        key = (cx, cy)
+        if key in self._evicted:
+            return TileMap(self._chunk_size, bytearray(zlib.decompress(self._evicted.pop(key))))
+        if self._directory and key in self._dirty:
+            with open(self._chunk_path(cx, cy), 'rb') as f:
+                return TileMap(self._chunk_size, bytearray(f.read()))
+        return None
+
+    def _gates(self, cx, cy):
+        """
+        :return: x, y inside the chunk of the gate on its west, east, south and north edge
+        """
+        size = self._chunk_size
+        # a gate is seeded by the edge it sits on, so the chunks on both sides agree on it
+        west = _random(self._seed, 'x', cx, cy).randrange(GATE_MARGIN, size - GATE_MARGIN)
+        east = _random(self._seed, 'x', cx + 1, cy).randrange(GATE_MARGIN, size - GATE_MARGIN)
+        south = _random(self._seed, 'y', cx, cy).randrange(GATE_MARGIN, size - GATE_MARGIN)
+        north = _random(self._seed, 'y', cx, cy + 1).randrange(GATE_MARGIN, size - GATE_MARGIN)
+        return (0, west), (size - 1, east), (south, 0), (north, size - 1)
+
+    def _generate_chunk(self, cx, cy):
+        logging.debug('Generating chunk {0},{1}'.format(cx, cy))
+        size = self._chunk_size
+        world = World(size, _random(self._seed, 'chunk', cx, cy).randrange(0, SEED_LIMIT))
+        world.generate()
+        tiles = world.get_tiles()
+
+        centers = [
+            (int(room.x + room.width / 2), int(room.y + room.height / 2)) for room in world.get_rooms()
+        ] or [(size // 2, size // 2)]
+
+        # tunnel from every gate to the nearest room
+        for gate_x, gate_y in self._gates(cx, cy):
+            end_x, end_y = min(centers, key=lambda center: abs(center[0] - gate_x) + abs(center[1] - gate_y))
+            path = world.find_path(gate_x, gate_y, end_x, end_y) + [(gate_x, gate_y)]
+            tiles.set_cells(path, TILE_FLOOR)
+            tiles.dilate(path, TILE_WALL)
+
+        if (cx, cy) == (0, 0):
+            self._spawn_x = world.get_spawn_x()
+            self._spawn_y = world.get_spawn_y()
+
+        # the chunk keeps only the tiles, the rooms and the pathfinding state go with the world
+        return TileMap(size, tiles.data)
+
+    def update(self, x, y):
+        """
+        Make sure the chunks around a position are resident, nothing is done until the position
+        enters another chunk
+        :param x: x in world pixels, usually of the player
+        :param y: y in world pixels
+        """
+        chunk_pixels = self._chunk_size * TILE_SIZE
+        cx = int(x // chunk_pixels)
+        cy = int(y // chunk_pixels)
+        if self._center == (cx, cy):
+            return
+        self._center = (cx, cy)
+
+        for ny in range(cy - STREAM_RADIUS, cy + STREAM_RADIUS + 1):
+            for nx in range(cx - STREAM_RADIUS, cx + STREAM_RADIUS + 1):
+                self.get_chunk(nx, ny)
+        # the chunk the position is in ends up the most recently used one
+        self.get_chunk(cx, cy)
+
+    def get_tile(self, x, y):
+        size = self._chunk_size
+        return self.get_chunk(x // size, y // size).data[(y % size) * size + x % size]
+
+    def set_tile(self, x, y, tile):
+        """
+        Change a single tile, the chunk it is in is kept from now on instead of regenerated
+        """
+        size = self._chunk_size
+        self.get_chunk(x // size, y // size).set_tile(x % size, y % size, tile)
+        self._dirty.add((x // size, y // size))
+
+    def get_window(self, x, y, width, height):
+        """
+        Copy a rectangle of tiles out of the chunks covering it
+        :return: bytearray of width * height tiles, row by row from the bottom
+        """
+        size = self._chunk_size
+        window = bytearray(width * height)
+        for cy in range(y // size, (y + height - 1) // size + 1):
+            for cx in range(x // size, (x + width - 1) // size + 1):
+                data = self.get_chunk(cx, cy).data
+                x0 = max(x, cx * size)
+                x1 = min(x + width, (cx + 1) * size)
+                for row in range(max(y, cy * size), min(y + height, (cy + 1) * size)):
+                    source = (row - cy * size) * size - cx * size
+                    target = (row - y) * width - x
+                    window[target + x0:target + x1] = data[source + x0:source + x1]
+        return window
+
+    def non_empty(self, x, y, width, height):
+        """
+        Yield x, y and tile for every non-empty tile inside a rectangle
+        """
+        window = self.get_window(x, y, width, height)
+        for match in NON_EMPTY_TILE.finditer(window):
+            index = match.start()
+            yield x + index % width, y + index // width, window[index]
+
+    def find_path(self, sx, sy, ex, ey):
+        """
+        Search a window of the world around the start and end, the window is paged in like any other
+        tiles so it should stay within a few chunks
+        :return: x, y of every tile from the end back to the start, without the start
+        """
+        x0 = min(sx, ex) - PATH_MARGIN
+        y0 = min(sy, ey) - PATH_MARGIN
+        side = max(abs(sx - ex), abs(sy - ey)) + 2 * PATH_MARGIN + 1
+        astar = AStar(Grid(self.get_window(x0, y0, side, side), side))
+        path = astar.find_path(sx - x0, sy - y0, ex - x0, ey - y0)
+        return [(x + x0, y + y0) for x, y in path]
@@ -0,0 +1,164 @@
+from .world import TILE_FLOOR
+
+# tiles the player can see in every direction
+VISION_RADIUS = 12
+
+# transforms from the octant being scanned to the map, one column per octant
+_OCTANTS = (
+    (1, 0, 0, -1, -1, 0, 0, 1),
+    (0, 1, -1, 0, 0, -1, 1, 0),
+    (0, 1, 1, 0, 0, -1, -1, 0),
+    (1, 0, 0, 1, -1, 0, 0, -1)
+)
+
+
+class Visibility:
+    """
+    Field of view of a single viewer over a tile map, found with recursive shadowcasting
+
+    Visible and explored tiles are kept as bit arrays, one bit per tile. The field is only recomputed
+    when the viewer enters another tile or a tile within sight is changed through the tile map, listeners are then told which tiles may have changed so
+    they only refresh those.
+    """
+
+    def __init__(self, tiles, radius=VISION_RADIUS, transparent=TILE_FLOOR):
+        """
+        :param tiles: TileMap to see across
+        :param radius: distance in tiles the viewer can see
+        :param transparent: tile value that can be seen through, every other tile blocks sight
+        """
+        self._tiles = tiles
+        self._size = tiles.size
+        self._radius = radius
+        self._transparent = transparent
+        self._viewer = None
+        # set when a tile within sight changed, the next update recomputes even on the same tile
+        self._stale = False
+        self._listeners = []
+
+        count = (self._size * self._size + 7) // 8
+        self.visible = bytearray(count)
+        self.explored = bytearray(count)
+        # indices of the visible tiles, so the next recompute only clears those
+        self._lit = []
+        tiles.add_listener(self._tiles_changed)
+
+    def add_listener(self, func):
+        """
+        Register a function called with x0, y0, x1, y1 of the inclusive rectangle of tiles every
+        recompute may have changed
+        """
+        self._listeners.append(func)
+
+    def is_visible(self, x, y):
+        index = y * self._size + x
+        return self.visible[index >> 3] & (1 << (index & 7)) != 0
+
+    def is_explored(self, x, y):
+        index = y * self._size + x
+        return self.explored[index >> 3] & (1 << (index & 7)) != 0
+
+    def update(self, x, y):
+        """
+        Move the viewer, the field of view is only recomputed if it entered another tile or the
+        tiles within sight changed
+        :return: True if the field of view was recomputed
+        """
+        if self._viewer == (x, y) and not self._stale:
+            return False
+
+        old = self._viewer
+        self._viewer = (x, y)
+        self._stale = False
+        self._recompute(x, y)
+
+        radius = self._radius
+        x0, y0, x1, y1 = x - radius, y - radius, x + radius, y + radius
+        if old:
+            x0 = min(x0, old[0] - radius)
+            y0 = min(y0, old[1] - radius)
+            x1 = max(x1, old[0] + radius)
+            y1 = max(y1, old[1] + radius)
+        for func in self._listeners:
+            func(max(x0, 0), max(y0, 0), min(x1, self._size - 1), min(y1, self._size - 1))
+        return True
+
+    def _tiles_changed(self, x0, y0, x1, y1):
+        if self._viewer is None:
+            return
+        radius = self._radius
+        vx, vy = self._viewer
+        if x0 <= vx + radius and x1 >= vx - radius and y0 <= vy + radius and y1 >= vy - radius:
+            self._stale = True
+
+    def _recompute(self, x, y):
+        visible = self.visible
+        for index in self._lit:
+            visible[index >> 3] &= ~(1 << (index & 7)) & 0xff
+        self._lit = []
+
+        self._light(x, y)
+        for octant in range(0, 8):
+            self._cast(
+                x, y, 1, 1.0, 0.0,
+                _OCTANTS[0][octant], _OCTANTS[1][octant], _OCTANTS[2][octant], _OCTANTS[3][octant]
+            )
+
+    def _light(self, x, y):
+        index = y * self._size + x
+        bit = 1 << (index & 7)
+        if not self.visible[index >> 3] & bit:
+            self.visible[index >> 3] |= bit
+            self.explored[index >> 3] |= bit
+            self._lit.append(index)
+
+    def _cast(self, cx, cy, row, start, end, xx, xy, yx, yy):
+        """
+        Scan one octant row by row, recursing whenever a blocking tile splits the visible slopes
+        :param start: slope the visible part of the row starts at
+        :param end: slope the visible part of the row ends at
+        """
+        if start < end:
+            return
+
+        size = self._size
+        data = self._tiles.data
+        transparent = self._transparent
+        radius = self._radius
+        radius_squared = radius * radius
+        new_start = start
+
+        for distance in range(row, radius + 1):
+            dx = -distance - 1
+            dy = -distance
+            blocked = False
+            while dx <= 0:
+                dx += 1
+                x = cx + dx * xx + dy * xy
+                y = cy + dx * yx + dy * yy
+                left_slope = (dx - 0.5) / (dy + 0.5)
+                right_slope = (dx + 0.5) / (dy - 0.5)
+                if start < right_slope:
+                    continue
+                if end > left_slope:
+                    break
+
+                # anything outside the map blocks sight and is never lit
+                inside = 0 <= x < size and 0 <= y < size
+                if inside and dx * dx + dy * dy < radius_squared:
+                    self._light(x, y)
+                opaque = not inside or data[y * size + x] != transparent
+
+                if blocked:
+                    if opaque:
+                        new_start = right_slope
+                        continue
+                    blocked = False
+                    start = new_start
+                elif opaque and distance < radius:
+                    blocked = True
+                    self._cast(cx, cy, distance + 1, start, left_slope, xx, xy, yx, yy)
+                    new_start = right_slope
+
+            if blocked:
+                break
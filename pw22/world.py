@@ -1,40 +1,329 @@
+import os
+import re
+import mmap
 import random
+import struct
 import logging
-import pyglet
+from array import array
 
-from .astar import AStar
+from .astar import AStar, Grid, PathCache
 
 WORLD_SIZE = 98
 
 ROOM_MAX_SIZE = 16
 ROOM_MIN_SIZE = 8
 ROOM_MAX_ATTEMPTS = 30
+ROOM_SPACING = 2
+
+# extra tunnels carved on top of the spanning tree of rooms, so the dungeon has some loops
+TUNNEL_LOOPS = 3
+# the loop tunnels are picked among this many of the shortest tunnels the tree left out
+TUNNEL_LOOP_CANDIDATES = 12
 
 TILE_SIZE = 64
 TILE_FLOOR = 10
 TILE_WALL = 50
 
-TEXTURE_FLOOR = pyglet.resource.texture('rock_floor.png')
-TEXTURE_WALL = pyglet.resource.texture('wall.gif')
+# bump whenever a change to generation makes the same seed produce a different world,
+# it is part of the snapshot cache key so stale snapshots are never loaded
+GENERATOR_VERSION = 3
+
+# seeds are stored in 32 bits by snapshots and replay logs, so only seeds below this are accepted
+SEED_LIMIT = 2 ** 32
+
+# snapshot layout: tiles (size * size bytes), rooms (x, y, width, height each), then the footer
+SNAPSHOT_MAGIC = b'PW22'
+SNAPSHOT_ROOM = struct.Struct('<4H')
+SNAPSHOT_FOOTER = struct.Struct('<4sHIIiiI')
+
+# matches any non-empty tile in a flat tile buffer
+NON_EMPTY_TILE = re.compile(b'[^\\x00]')
+
+
+def pick_seed(seed=None):
+    """
+    :return: the seed, or a random one if it is None
+    :raises ValueError: if the seed does not fit in the 32 bits snapshots and replay logs store it in
+    """
+    if seed is None:
+        return random.randrange(0, SEED_LIMIT)
+    if not 0 <= seed < SEED_LIMIT:
+        raise ValueError('Seed must be between 0 and {0}: {1}'.format(SEED_LIMIT - 1, seed))
+    return seed
+
+
+class TileMap:
+    """
+    Square uint8 tile map stored in one flat bytearray
+
+    Rows are memoryviews into the flat buffer so tiles[y][x] reads and writes keep working for
+    existing callers, while bulk operations work on whole slices of the buffer.
+    """
+
+    def __init__(self, size, data=None):
+        """
+        :param size: width and height of the map in tiles
+        :param data: optional writable buffer of size * size tiles to use as storage,
+        for example a copy-on-write mmap of a snapshot
+        """
+        self.size = size
+        self.data = data if data is not None else bytearray(size * size)
+        view = memoryview(self.data)
+        self._rows = [view[y * size:(y + 1) * size] for y in range(0, size)]
+        self._listeners = []
+
+    def __reduce__(self):
+        # memoryviews can't be pickled, send the raw buffer and rebuild the rows on the other side
+        return TileMap, (self.size, bytearray(self.data))
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, y):
+        return self._rows[y]
+
+    def add_listener(self, func):
+        """
+        Register a function called with x0, y0, x1, y1 of the inclusive rectangle of every change made
+        through the methods of the map. Writes straight to rows or data are not reported.
+        """
+        self._listeners.append(func)
+
+    def _changed(self, x0, y0, x1, y1):
+        for func in self._listeners:
+            func(x0, y0, x1, y1)
+
+    def get_tile(self, x, y):
+        return self.data[y * self.size + x]
+
+    def set_tile(self, x, y, tile):
+        self.data[y * self.size + x] = tile
+        self._changed(x, y, x, y)
+
+    def fill_rect(self, x, y, width, height, tile):
+        span = bytes((tile,)) * width
+        for row in range(y, y + height):
+            start = row * self.size + x
+            self.data[start:start + width] = span
+        self._changed(x, y, x + width - 1, y + height - 1)
+
+    def set_cells(self, cells, tile):
+        if not cells:
+            return
+        for x, y in cells:
+            self.data[y * self.size + x] = tile
+        self._changed(
+            min(x for x, y in cells), min(y for x, y in cells),
+            max(x for x, y in cells), max(y for x, y in cells)
+        )
+
+    def dilate(self, cells, tile):
+        """
+        Fill every empty tile in the 3x3 neighbourhood of the given cells
+        :param cells: iterable of x, y tuples
+        :param tile: tile to fill the empty neighbours with
+        """
+        # collect the covered columns per row and fill each row span in one slice operation
+        spans = {}
+        for x, y in cells:
+            lo = max(x - 1, 0)
+            hi = min(x + 2, self.size)
+            for row in range(max(y - 1, 0), min(y + 2, self.size)):
+                spans.setdefault(row, []).append((lo, hi))
+
+        if not spans:
+            return
+
+        fill = bytes((tile,))
+        x0 = self.size
+        x1 = 0
+        for row, intervals in spans.items():
+            intervals.sort()
+            x0 = min(x0, intervals[0][0])
+            x1 = max(x1, max(hi for lo, hi in intervals) - 1)
+            offset = row * self.size
+            start, end = intervals[0]
+            for lo, hi in intervals[1:] + [(self.size + 1, 0)]:
+                if lo > end:
+                    self.data[offset + start:offset + end] = \
+                        bytes(self.data[offset + start:offset + end]).replace(b'\x00', fill)
+                    start, end = lo, hi
+                else:
+                    end = max(end, hi)
+
+        self._changed(x0, min(spans), x1, max(spans))
+
+    def non_empty(self, x=0, y=0, width=None, height=None):
+        """
+        Yield x, y and tile for every non-empty tile, optionally limited to a rectangle.
+        The scan itself runs in C, one row at a time for a rectangle.
+        """
+        if width is None and height is None:
+            for match in NON_EMPTY_TILE.finditer(self.data):
+                index = match.start()
+                yield index % self.size, index // self.size, self.data[index]
+            return
+
+        end_x = min(x + width, self.size)
+        for row in range(y, min(y + height, self.size)):
+            offset = row * self.size
+            for match in NON_EMPTY_TILE.finditer(self.data, offset + x, offset + end_x):
+                index = match.start()
+                yield index - offset, row, self.data[index]
 
 
 class Room:
-    x = None
-    y = None
-    width = None
-    height = None
+
+    __slots__ = ('x', 'y', 'width', 'height')
+
+    def __init__(self, x=None, y=None, width=None, height=None):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+
+
+class UnionFind:
+    """
+    Disjoint sets over the integers 0 to count - 1
+    """
+
+    def __init__(self, count):
+        self._parent = list(range(0, count))
+        self._size = [1] * count
+        self.sets = count
+
+    def find(self, item):
+        parent = self._parent
+        while parent[item] != item:
+            # path halving, every other node on the way now points to its grandparent
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    def union(self, a, b):
+        """
+        :return: True if a and b were in different sets
+        """
+        a = self.find(a)
+        b = self.find(b)
+        if a == b:
+            return False
+        if self._size[a] < self._size[b]:
+            a, b = b, a
+        self._parent[b] = a
+        self._size[a] += self._size[b]
+        self.sets -= 1
+        return True
+
+
+class RoomIndex:
+    """
+    Uniform grid of buckets over the world holding the rooms that reserve each cell
+
+    A room reserves its own rectangle plus the spacing kept between rooms, so an overlap test only
+    has to look at the rooms in the cells a candidate touches. Cells nothing has reserved yet are
+    kept in a free list to draw new candidates from.
+    """
+
+    def __init__(self, size, cell_size, spacing):
+        self._cell_size = cell_size
+        self._spacing = spacing
+        self._columns = size // cell_size + 1
+        self._buckets = [[] for _ in range(0, self._columns * self._columns)]
+        # cells lying in the border no room fits into are never offered as free
+        limit = (size - spacing - ROOM_MIN_SIZE) // cell_size
+        self._free = [
+            cell for cell in range(0, len(self._buckets))
+            if cell % self._columns < limit and cell // self._columns < limit
+        ]
+        # position of every free cell in the free list, so a cell can be removed in O(1)
+        self._free_positions = {cell: i for i, cell in enumerate(self._free)}
+
+    def _cells(self, x0, y0, x1, y1):
+        columns = self._columns
+        cx0 = max(x0 // self._cell_size, 0)
+        cy0 = max(y0 // self._cell_size, 0)
+        cx1 = min(x1 // self._cell_size, columns - 1)
+        cy1 = min(y1 // self._cell_size, columns - 1)
+        for cy in range(cy0, cy1 + 1):
+            for cx in range(cx0, cx1 + 1):
+                yield cy * columns + cx
+
+    def _take_free(self, cell):
+        position = self._free_positions.pop(cell, None)
+        if position is None:
+            return
+        # swap the last free cell into the hole
+        last = self._free.pop()
+        if last != cell:
+            self._free[position] = last
+            self._free_positions[last] = position
+
+    def has_free_cells(self):
+        return len(self._free) > 0
+
+    def random_free_cell(self, rng):
+        """
+        :param rng: random number generator to draw from
+        :return: x, y tile coordinates of a random point inside a random free cell
+        """
+        cell = self._free[rng.randrange(0, len(self._free))]
+        return (
+            (cell % self._columns) * self._cell_size + rng.randrange(0, self._cell_size),
+            (cell // self._columns) * self._cell_size + rng.randrange(0, self._cell_size)
+        )
+
+    def insert(self, room):
+        spacing = self._spacing
+        for cell in self._cells(room.x - spacing, room.y - spacing,
+                                room.x + room.width + spacing, room.y + room.height + spacing):
+            self._buckets[cell].append(room)
+            self._take_free(cell)
+
+    def intersects(self, room, test):
+        """
+        :param room: candidate room
+        :param test: function deciding if two rooms intersect
+        :return: True if the candidate intersects any room in the index
+        """
+        for cell in self._cells(room.x, room.y, room.x + room.width, room.y + room.height):
+            for other in self._buckets[cell]:
+                if test(room, other):
+                    return True
+        return False
 
 
 class World:
 
+    _size = WORLD_SIZE
+    _seed = None
+    _random = None
     _astar = None
+    _grid = None
+    _path_cache = None
     _rooms = []
     _tiles = []
-    _sprites = []
-    _batch = None
     _spawn_x = None
     _spawn_y = None
 
+    def __init__(self, size=WORLD_SIZE, seed=None):
+        """
+        :param size: width and height of the world in tiles
+        :param seed: seed for generation, a random one is picked if omitted
+        """
+        self._size = size
+        self._seed = pick_seed(seed)
+
+    def get_size(self):
+        return self._size
+
+    def get_seed(self):
+        return self._seed
+
+    def get_rooms(self):
+        return self._rooms
+
     def get_tiles(self):
         return self._tiles
 
@@ -44,150 +333,281 @@ class World:
     def get_spawn_y(self):
         return self._spawn_y
 
+    def __getstate__(self):
+        # the pathfinding state is only scratch space, it is rebuilt on demand after unpickling
+        state = self.__dict__.copy()
+        state.pop('_astar', None)
+        state.pop('_grid', None)
+        state.pop('_path_cache', None)
+        return state
+
+    def get_snapshot(self):
+        """
+        :return: the generated state of the world as bytes, in the same layout save writes
+        """
+        rooms = b''.join(SNAPSHOT_ROOM.pack(room.x, room.y, room.width, room.height) for room in self._rooms)
+        return bytes(self._tiles.data) + rooms + SNAPSHOT_FOOTER.pack(
+            SNAPSHOT_MAGIC,
+            GENERATOR_VERSION,
+            self._size,
+            self._seed,
+            self._spawn_x or 0,
+            self._spawn_y or 0,
+            len(self._rooms)
+        )
+
+    def save(self, path):
+        """
+        Write the generated state of the world to a compact binary snapshot
+        """
+        with open(path, 'wb') as f:
+            f.write(self.get_snapshot())
+
+    @classmethod
+    def _read_snapshot(cls, data, source):
+        """
+        Create a world from the rooms and footer of a snapshot, the caller places the tiles
+        :param data: the whole snapshot, any buffer
+        :param source: what the snapshot was read from, for error messages
+        """
+        if len(data) < SNAPSHOT_FOOTER.size:
+            raise ValueError('Not a world snapshot: {0}'.format(source))
+        magic, version, size, seed, spawn_x, spawn_y, room_count = SNAPSHOT_FOOTER.unpack_from(
+            data, len(data) - SNAPSHOT_FOOTER.size
+        )
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError('Not a world snapshot: {0}'.format(source))
+        if version != GENERATOR_VERSION:
+            # the same seed generates a different world now, the rooms and tiles would not match it
+            raise ValueError('World snapshot {0} is from generator version {1}, expected {2}'.format(
+                source, version, GENERATOR_VERSION
+            ))
+
+        world = cls(size, seed)
+        world._spawn_x = spawn_x
+        world._spawn_y = spawn_y
+        world._rooms = [
+            Room(*SNAPSHOT_ROOM.unpack_from(data, size * size + i * SNAPSHOT_ROOM.size)) for i in range(0, room_count)
+        ]
+        return world
+
+    @classmethod
+    def from_snapshot(cls, data):
+        """
+        Create a world from the bytes returned by get_snapshot, the tiles are copied into a new map
+        """
+        world = cls._read_snapshot(data, 'in memory')
+        world._tiles = TileMap(world._size, bytearray(data[:world._size * world._size]))
+        return world
+
+    @classmethod
+    def load(cls, path):
+        """
+        Create a world from a snapshot written by save, the tiles are memory mapped copy-on-write
+        """
+        with open(path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as snapshot:
+                world = cls._read_snapshot(snapshot, path)
+
+            # the map stays valid after the file is closed, ACCESS_COPY keeps writes private
+            size = world._size
+            world._tiles = TileMap(size, mmap.mmap(f.fileno(), size * size, access=mmap.ACCESS_COPY))
+
+        logging.debug('Loaded world {0} from {1}'.format(world._seed, path))
+        return world
+
     def _reset(self):
+        self._random = random.Random(self._seed)
         self._astar = None
+        self._grid = None
+        self._path_cache = None
         self._rooms = []
-        self._tiles = []
-        self._sprites = []
-        self._batch = pyglet.graphics.Batch()
+        self._tiles = TileMap(self._size)
         self._spawn_x = None
         self._spawn_y = None
 
     def generate(self):
-        logging.debug('Generating world')
+        logging.debug('Generating world {0}'.format(self._seed))
         self._reset()
-        # initialize the 2d array according to the world size
-        for y in range(0, WORLD_SIZE):
-            self._tiles.append([0] * WORLD_SIZE)
-
         self._create_rooms()
         self._create_tunnels()
-        self._create_sprites()
+
+    def _create_pathfinder(self):
+        # the grid reads weights straight from the tile buffer so carved tiles are seen by later searches
+        self._grid = Grid(self._tiles.data, self._size)
+        self._astar = AStar(self._grid)
+        # any change to the tiles drops the cached paths whose search looked at them
+        self._path_cache = PathCache()
+        self._tiles.add_listener(self._path_cache.invalidate)
 
     def _create_rooms(self):
-        no_of_rooms = WORLD_SIZE / 4.5
+        no_of_rooms = self._size / 4.5
         logging.debug('Creating {0} rooms'.format(no_of_rooms))
+        index = RoomIndex(self._size, ROOM_MAX_SIZE, ROOM_SPACING)
+        attempts = 0
         for i in range(0, int(no_of_rooms)):
-            logging.debug('Room #{0}'.format(i))
             attempt = 0  # current attempt
             room = Room()
             while attempt < ROOM_MAX_ATTEMPTS:
-                logging.debug('Attempt #{0}'.format(attempt))
+                attempts += 1
                 # give some initial random values to the room
-                room.x = random.randrange(2, WORLD_SIZE)
-                room.y = random.randrange(2, WORLD_SIZE)
-                room.width = random.randrange(ROOM_MIN_SIZE, ROOM_MAX_SIZE)
-                room.height = random.randrange(ROOM_MIN_SIZE, ROOM_MAX_SIZE)
+                room.width = self._random.randrange(ROOM_MIN_SIZE, ROOM_MAX_SIZE)
+                room.height = self._random.randrange(ROOM_MIN_SIZE, ROOM_MAX_SIZE)
 
                 # adjust room height if needed
                 while room.height < room.width / 2.5 or room.height > room.width * 1.5:
-                    logging.debug('Adjusting room size')
-                    room.height = random.randrange(room.width, ROOM_MAX_SIZE)
+                    room.height = self._random.randrange(room.width, ROOM_MAX_SIZE)
+
+                # prefer centering the room on a cell no other room has reserved yet
+                if index.has_free_cells():
+                    center_x, center_y = index.random_free_cell(self._random)
+                    room.x = min(max(center_x - room.width // 2, 2), self._size - 3 - room.width)
+                    room.y = min(max(center_y - room.height // 2, 2), self._size - 3 - room.height)
+                else:
+                    room.x = self._random.randrange(2, self._size)
+                    room.y = self._random.randrange(2, self._size)
 
                 # out of bounds, try again
-                if room.x + room.width >= WORLD_SIZE - 2 or room.y + room.height >= WORLD_SIZE - 2:
+                if room.x + room.width >= self._size - 2 or room.y + room.height >= self._size - 2:
                     attempt += 1
                     continue
 
-                # determine if this room intersects with any other room
-                intersects = False
-                for j in range(0, len(self._rooms)):
-                    if self._rooms_intersect(room, self._rooms[j]):
-                        intersects = True
-                        break
-
-                # found an intersection, try again
-                if intersects:
+                # found an intersection with a nearby room, try again
+                if index.intersects(room, self._rooms_intersect):
                     attempt += 1
                     continue
 
                 # add room data to our 2d tile array
-                logging.debug('Adding room data to world')
-                y = room.y
-                while y <= room.y + room.height:
-                    x = room.x
-                    while x <= room.x + room.width:
-                        if x == room.x or x == room.x + room.width or y == room.y or y == room.y + room.height:
-                            self._tiles[y][x] = TILE_WALL
-                        else:
-                            self._tiles[y][x] = TILE_FLOOR
-                        x += 1
-                    y += 1
+                self._tiles.fill_rect(room.x, room.y, room.width + 1, room.height + 1, TILE_WALL)
+                self._tiles.fill_rect(room.x + 1, room.y + 1, room.width - 1, room.height - 1, TILE_FLOOR)
 
                 self._rooms.append(room)
+                index.insert(room)
                 # set the players spawn to the first room generated
                 if not self._spawn_x and not self._spawn_y:
                     self._spawn_x = int((room.x * TILE_SIZE) + ((room.width / 2) * TILE_SIZE))
                     self._spawn_y = int((room.y * TILE_SIZE) + ((room.height / 2) * TILE_SIZE))
                 break
 
+        logging.debug('Placed {0} rooms in {1} attempts'.format(len(self._rooms), attempts))
+
     def _create_tunnels(self):
+        """
+        Connect the rooms along a minimum spanning tree of their centres plus a few loops
+
+        Candidate tunnels are tried shortest first, and one is only searched for and carved if it joins
+        two rooms that are not connected yet. Every room a carved tunnel passes through counts as
+        connected too, so later candidates between them are skipped without a search.
+        """
         logging.debug('Creating tunnels')
-        for room in self._rooms:
-            target_room = None
-
-            # get a random target
-            while not target_room:
-                target_room = self._rooms[random.randrange(0, len(self._rooms))]
-                if room == target_room:  # same as current room
-                    target_room = None
-                    continue
+        self._create_pathfinder()
+        centers = [(int(room.x + (room.width / 2)), int(room.y + (room.height / 2))) for room in self._rooms]
+        candidates = sorted(
+            (abs(ax - bx) + abs(ay - by), a, b)
+            for a, (ax, ay) in enumerate(centers)
+            for b, (bx, by) in enumerate(centers[a + 1:], a + 1)
+        )
 
-            # calculate the center of the rooms
-            start_x = int(room.x + (room.width / 2))
-            start_y = int(room.y + (room.height / 2))
-            end_x = int(target_room.x + (target_room.width / 2))
-            end_y = int(target_room.y + (target_room.height / 2))
-            logging.debug('Tunneling from {0},{1} to {2},{3}'.format(start_x, start_y, end_x, end_y))
-
-            self._astar = AStar(self._tiles, WORLD_SIZE)
-            path = self.find_path(start_x, start_y, end_x, end_y)
-            # add the tunnel to the 2d tile array
-            for pos in path:
-                self._tiles[pos[0]][pos[1]] = 10
-
-            logging.debug('Adding walls to tunnels')
-            # add walls around the tunnel
-            for pos in path:
-                for x in [-1, 0, 1]:
-                    for y in [-1, 0, 1]:
-                        ty = pos[0] + y
-                        tx = pos[1] + x
-                        if self._tiles[ty][tx] == 0:
-                            self._tiles[ty][tx] = TILE_WALL
-
-    def _create_sprites(self):
-        logging.debug('Creating sprites')
-        for y in range(0, WORLD_SIZE):
-            for x in range(0, WORLD_SIZE):
-                tile = self._tiles[y][x]
-                if tile == 0:
-                    continue
-                self._sprites.append(
-                    pyglet.sprite.Sprite(
-                        x=x * TILE_SIZE,
-                        y=y * TILE_SIZE,
-                        img=self._get_tile_texture(tile),
-                        batch=self._batch
-                    )
-                )
-
-    def _get_tile_texture(self, tile):
-        if tile == TILE_FLOOR:
-            return TEXTURE_FLOOR
-        if tile == TILE_WALL:
-            return TEXTURE_WALL
+        owners = self._room_owners()
+        components = UnionFind(len(self._rooms))
+        spare = []
+        searches = 0
+        for distance, a, b in candidates:
+            if components.find(a) == components.find(b):
+                if len(spare) < TUNNEL_LOOP_CANDIDATES:
+                    spare.append((a, b))
+                continue
+            self._carve_tunnel(centers[a], centers[b], a, owners, components)
+            searches += 1
+
+        for a, b in self._random.sample(spare, min(TUNNEL_LOOPS, len(spare))):
+            self._carve_tunnel(centers[a], centers[b], a, owners, components)
+            searches += 1
+
+        logging.debug('Carved {0} tunnels between {1} rooms'.format(searches, len(self._rooms)))
+
+    def _room_owners(self):
+        """
+        :return: array of the index of the room whose floor covers each tile, -1 outside rooms
+        """
+        owners = array('h', [-1]) * (self._size * self._size)
+        for i, room in enumerate(self._rooms):
+            span = array('h', [i]) * (room.width - 1)
+            for y in range(room.y + 1, room.y + room.height):
+                start = y * self._size + room.x + 1
+                owners[start:start + room.width - 1] = span
+        return owners
+
+    def _carve_tunnel(self, start, end, room, owners, components):
+        start_x, start_y = start
+        end_x, end_y = end
+        logging.debug('Tunneling from {0},{1} to {2},{3}'.format(start_x, start_y, end_x, end_y))
+
+        path = self.find_path(start_x, start_y, end_x, end_y)
+        # add the tunnel to the 2d tile array
+        self._tiles.set_cells(path, TILE_FLOOR)
+        # add walls around the tunnel
+        self._tiles.dilate(path, TILE_WALL)
+
+        # the path ends in the centre of the target room, so that one is always joined
+        for x, y in path:
+            owner = owners[y * self._size + x]
+            if owner != -1:
+                components.union(room, owner)
 
     def _rooms_intersect(self, a, b):
         return (
-            a.x < (b.x + b.width) + 2 and
-            a.x + a.width > b.x - 2 and
-            a.y < (b.y + b.height) + 2 and
-            a.y + a.height > b.y - 2
+            a.x < (b.x + b.width) + ROOM_SPACING and
+            a.x + a.width > b.x - ROOM_SPACING and
+            a.y < (b.y + b.height) + ROOM_SPACING and
+            a.y + a.height > b.y - ROOM_SPACING
         )
 
-    def find_path(self, sx, sy, ex, ey):
-        return self._astar.find_path(sx, sy, ex, ey)
+    def set_tile(self, x, y, tile):
+        """
+        Change a single tile after generation, for example to break a wall
+        """
+        self._tiles.set_tile(x, y, tile)
 
-    def on_draw(self):
-        self._batch.draw()
+    def find_path(self, sx, sy, ex, ey):
+        """
+        :return: x, y of every tile from the end back to the start, without the start.
+        The path may be shared with later calls, callers must not modify it.
+        """
+        if not self._astar:
+            self._create_pathfinder()
+
+        path = self._path_cache.get(sx, sy, ex, ey)
+        if path is None:
+            path = self._astar.find_path(sx, sy, ex, ey)
+            self._path_cache.put(sx, sy, ex, ey, path, self._astar.get_search_bounds())
+        return path
+
+
+class WorldCache:
+    """
+    Directory of world snapshots keyed by seed, world size and generator version
+    """
+
+    def __init__(self, directory):
+        self._directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, seed, size):
+        return os.path.join(self._directory, '{0}-{1}-{2}.world'.format(seed, size, GENERATOR_VERSION))
+
+    def get(self, seed, size=WORLD_SIZE):
+        """
+        Load the world for a seed from the cache, generating and storing it first if needed
+        """
+        path = self._path(seed, size)
+        if os.path.exists(path):
+            return World.load(path)
+
+        world = World(size, seed)
+        world.generate()
+        # write to a temporary file first so a concurrent reader never sees a partial snapshot
+        temporary_path = '{0}.{1}.tmp'.format(path, os.getpid())
+        world.save(temporary_path)
+        os.replace(temporary_path, path)
+        return world
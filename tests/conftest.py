@@ -0,0 +1,4 @@
+import pyglet
+
+# the tests run without a display, scenes reading key symbols must not open a hidden window
+pyglet.options['shadow_window'] = False
@@ -0,0 +1,25 @@
+import pyglet
+import pytest
+
+from pw22.assets import AssetRegistry, PACK_PATH, PACK_MAGIC, PACK_VERSION, PACK_HEADER, PACK_NAME_SIZE
+from pw22.bake import bake
+
+
+def test_pack_path_is_resolved_against_the_script_home(tmp_path, monkeypatch):
+    pack = tmp_path / PACK_PATH
+    pack.parent.mkdir(parents=True)
+    pack.write_bytes(PACK_HEADER.pack(PACK_MAGIC, PACK_VERSION, 1, 1, 0) + b'\x00' * 4)
+
+    # run from anywhere but the script home, the pack must still be found
+    monkeypatch.chdir(str(tmp_path.parent))
+    monkeypatch.setattr(pyglet.resource, 'get_script_home', lambda: str(tmp_path))
+    assert AssetRegistry().get_pack() is not None
+    monkeypatch.setattr(pyglet.resource, 'get_script_home', lambda: str(tmp_path.parent))
+    assert AssetRegistry().get_pack() is None
+
+
+def test_bake_rejects_names_the_pack_can_not_hold(tmp_path):
+    output = tmp_path / 'assets.pack'
+    with pytest.raises(ValueError):
+        bake(['a' * (PACK_NAME_SIZE - 4) + '.png', 'b' * (PACK_NAME_SIZE - 3) + '.png'], str(output), [str(tmp_path)])
+    assert not output.exists()
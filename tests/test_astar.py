@@ -0,0 +1,65 @@
+import heapq
+import random
+
+from pw22.astar import AStar, Grid
+from pw22.world import TILE_FLOOR, TILE_WALL
+
+
+def _random_tiles(size, seed):
+    rng = random.Random(seed)
+    return bytearray(rng.choice((0, 0, TILE_FLOOR, TILE_WALL)) for i in range(0, size * size))
+
+
+def _step_cost(tiles, index):
+    return 10 + tiles[index] * 2
+
+
+def _path_cost(tiles, size, path):
+    return sum(_step_cost(tiles, y * size + x) for x, y in path)
+
+
+def _dijkstra(tiles, size, sx, sy, ex, ey):
+    cost = {sy * size + sx: 0}
+    heap = [(0, sy * size + sx)]
+    while heap:
+        c, index = heapq.heappop(heap)
+        if index == ey * size + ex:
+            return c
+        if c > cost[index]:
+            continue
+        x, y = index % size, index // size
+        for nx, ny in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+            if 0 <= nx < size and 0 <= ny < size:
+                node = ny * size + nx
+                new = c + _step_cost(tiles, node)
+                if new < cost.get(node, new + 1):
+                    cost[node] = new
+                    heapq.heappush(heap, (new, node))
+
+
+def test_find_path_is_cheapest():
+    size = 24
+    for seed in range(0, 10):
+        tiles = _random_tiles(size, seed)
+        astar = AStar(Grid(tiles, size))
+        rng = random.Random(seed)
+        for i in range(0, 10):
+            sx, sy, ex, ey = (rng.randrange(0, size) for j in range(0, 4))
+            path = astar.find_path(sx, sy, ex, ey)
+            assert _path_cost(tiles, size, path) == _dijkstra(tiles, size, sx, sy, ex, ey)
+
+
+def test_find_path_is_connected_and_ends_at_the_end():
+    size = 16
+    tiles = _random_tiles(size, 1)
+    path = AStar(Grid(tiles, size)).find_path(1, 2, 14, 11)
+    assert path[0] == (14, 11)
+    previous = (1, 2)
+    for x, y in reversed(path):
+        assert abs(x - previous[0]) + abs(y - previous[1]) == 1
+        previous = (x, y)
+
+
+def test_find_path_to_the_start_is_empty():
+    tiles = bytearray(16 * 16)
+    assert AStar(Grid(tiles, 16)).find_path(3, 3, 3, 3) == []
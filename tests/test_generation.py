@@ -0,0 +1,14 @@
+import pytest
+
+from pw22.generation import WorldGenerator
+
+
+def test_generator_runs_out_with_its_seeds():
+    world_generator = WorldGenerator(98, prefetch=2, workers=1, seeds=[4, 5, 6])
+    try:
+        assert [world_generator.get().get_seed() for i in range(0, 3)] == [4, 5, 6]
+        assert not world_generator.is_ready()
+        with pytest.raises(RuntimeError):
+            world_generator.get()
+    finally:
+        world_generator.shutdown()
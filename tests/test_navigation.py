@@ -0,0 +1,100 @@
+import random
+from collections import deque
+
+import pytest
+
+from pw22.navigation import FlowField, HierarchicalPathfinder
+from pw22.world import World, TILE_FLOOR, TILE_WALL
+
+
+def _bfs_distances(tiles, start):
+    """
+    :return: dict of tile index -> steps from the start over floor tiles
+    """
+    size = tiles.size
+    data = tiles.data
+    distances = {start: 0}
+    queue = deque([start])
+    while queue:
+        current = queue.popleft()
+        x = current % size
+        for node in (
+            current - 1 if x > 0 else -1,
+            current + 1 if x < size - 1 else -1,
+            current - size,
+            current + size
+        ):
+            if 0 <= node < len(data) and node not in distances and data[node] == TILE_FLOOR:
+                distances[node] = distances[current] + 1
+                queue.append(node)
+    return distances
+
+
+def _walk(path):
+    tiles = []
+    while path.has_next_leg():
+        tiles.extend(path.next_leg())
+    return tiles
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_path_length_matches_the_shortest_walk(seed):
+    world = World(98, seed)
+    world.generate()
+    tiles = world.get_tiles()
+    size = tiles.size
+    pathfinder = HierarchicalPathfinder(world)
+    floor = [index for index, tile in enumerate(tiles.data) if tile == TILE_FLOOR]
+
+    rng = random.Random(seed)
+    for i in range(0, 40):
+        start = rng.choice(floor)
+        end = rng.choice(floor)
+        distances = _bfs_distances(tiles, start)
+        path = pathfinder.find_path(start % size, start // size, end % size, end // size)
+        if end not in distances:
+            assert path is None
+            continue
+
+        walked = _walk(path)
+        assert len(walked) == distances[end]
+        # every step goes to a neighbouring floor tile and the walk ends on the target
+        x, y = start % size, start // size
+        for nx, ny in walked:
+            assert abs(nx - x) + abs(ny - y) == 1
+            assert tiles.get_tile(nx, ny) == TILE_FLOOR
+            x, y = nx, ny
+        assert (x, y) == (end % size, end // size)
+
+
+def test_path_to_the_start_has_no_steps():
+    world = World(98, 4)
+    world.generate()
+    room = world.get_rooms()[0]
+    x, y = room.x + 1, room.y + 1
+    path = HierarchicalPathfinder(world).find_path(x, y, x, y)
+    assert _walk(path) == []
+
+
+def test_flow_field_rebuilds_when_a_tile_it_covers_changes():
+    world = World(98, 5)
+    world.generate()
+    tiles = world.get_tiles()
+    room = world.get_rooms()[0]
+    tx, ty = room.x + room.width // 2, room.y + room.height // 2
+    field = FlowField(tiles, max_distance=8)
+    assert field.update(tx, ty)
+
+    # wall off the step a tile two steps away takes toward the target
+    x, y = tx + 2, ty
+    step = field.next_step(x, y)
+    world.set_tile(step[0], step[1], TILE_WALL)
+    assert field.update(tx, ty)
+    assert field.get_distance(*step) is None
+    assert field.next_step(x, y) != step
+    # around the new wall through the room
+    assert field.get_distance(x, y) == 4
+
+    # a change beyond the reach of the field leaves it alone
+    world.set_tile(0 if tx > tiles.size // 2 else tiles.size - 1, ty, TILE_WALL)
+    assert not field.update(tx, ty)
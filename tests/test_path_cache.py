@@ -0,0 +1,59 @@
+import random
+from collections import OrderedDict
+
+from pw22.astar import AStar, Grid, PathCache
+from pw22.world import World, TILE_FLOOR, TILE_WALL
+
+
+def test_cached_paths_match_fresh_searches_after_random_edits():
+    world = World(98, 8)
+    world.generate()
+    tiles = world.get_tiles()
+    floor = [(x, y) for y in range(0, tiles.size) for x in range(0, tiles.size) if tiles.get_tile(x, y) == TILE_FLOOR]
+
+    rng = random.Random(8)
+    pairs = [rng.choice(floor) + rng.choice(floor) for i in range(0, 30)]
+    for i in range(0, 100):
+        if rng.random() < 0.5:
+            tile = rng.choice((0, TILE_FLOOR, TILE_WALL))
+            if rng.random() < 0.5:
+                world.set_tile(rng.randrange(0, tiles.size), rng.randrange(0, tiles.size), tile)
+            else:
+                x, y = rng.randrange(0, tiles.size - 4), rng.randrange(0, tiles.size - 4)
+                tiles.fill_rect(x, y, rng.randint(1, 4), rng.randint(1, 4), tile)
+
+        sx, sy, ex, ey = rng.choice(pairs)
+        fresh = AStar(Grid(bytearray(tiles.data), tiles.size)).find_path(sx, sy, ex, ey)
+        assert world.find_path(sx, sy, ex, ey) == fresh
+
+
+def test_invalidate_and_eviction_match_a_plain_model():
+    rng = random.Random(9)
+    cache = PathCache(capacity=16, cell_size=8)
+    model = OrderedDict()  # key -> bounds, oldest first
+    for i in range(0, 2000):
+        if rng.random() < 0.6:
+            key = tuple(rng.randrange(0, 64) for j in range(0, 4))
+            x0, y0 = rng.randrange(0, 64), rng.randrange(0, 64)
+            bounds = (x0, y0, x0 + rng.randrange(0, 24), y0 + rng.randrange(0, 24))
+            cache.put(*key, path=[key], bounds=bounds)
+            model.pop(key, None)
+            if len(model) >= 16:
+                model.popitem(last=False)
+            model[key] = bounds
+        elif rng.random() < 0.5:
+            x0, y0 = rng.randrange(0, 64), rng.randrange(0, 64)
+            x1, y1 = x0 + rng.randrange(0, 8), y0 + rng.randrange(0, 8)
+            cache.invalidate(x0, y0, x1, y1)
+            for key, bounds in list(model.items()):
+                if bounds[0] <= x1 and bounds[2] >= x0 and bounds[1] <= y1 and bounds[3] >= y0:
+                    del model[key]
+        elif model:
+            key = rng.choice(list(model))
+            assert cache.get(*key) == [key]
+            model.move_to_end(key)
+
+        assert len(cache) == len(model)
+
+    for key in model:
+        assert cache.get(*key) == [key]
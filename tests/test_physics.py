@@ -0,0 +1,126 @@
+import random
+from array import array
+
+from pw22.actors import Actor, ActorStore
+from pw22.physics import (
+    PhysicsWorld, Circle, CONTACT_LEFT, CONTACT_RIGHT, CONTACT_BOTTOM, CONTACT_TOP
+)
+from pw22.scenes import SceneManager, GameScene
+from pw22.streaming import ChunkedWorld
+from pw22.world import World, TILE_SIZE, TILE_FLOOR
+
+CALLBACK_FLAGS = {'left': CONTACT_LEFT, 'right': CONTACT_RIGHT, 'bottom': CONTACT_BOTTOM, 'top': CONTACT_TOP}
+
+
+class Walker(Actor):
+    """
+    Actor without a collision callback, collided in bulk with its store
+    """
+
+    def __init__(self, radius):
+        super().__init__()
+        self._physics_shape = Circle(radius)
+
+
+def _random_circles(floor, count, seed):
+    rng = random.Random(seed)
+    circles = []
+    for i in range(0, count):
+        x, y = rng.choice(floor)
+        circle = Circle(rng.choice((8, 16, 32, 40)))
+        # tile edges included, they decide between a contact and none
+        circle.x = x * TILE_SIZE + rng.choice((0.0, rng.random() * TILE_SIZE))
+        circle.y = y * TILE_SIZE + rng.choice((0.0, rng.random() * TILE_SIZE))
+        circles.append(circle)
+    return circles
+
+
+def _callback_flags(physics_world, circle):
+    flags = []
+
+    def callback(**kwargs):
+        flags.extend(CALLBACK_FLAGS[name] for name in kwargs)
+
+    circle.set_callback(callback)
+    physics_world.collide(circle)
+    return sum(set(flags))
+
+
+def _check_batch_matches_callbacks(world, floor):
+    physics_world = PhysicsWorld(world)
+    circles = _random_circles(floor, 500, world.get_seed())
+    contacts = array('B', bytes(len(circles)))
+    physics_world.collide_batch(
+        array('d', (circle.x for circle in circles)),
+        array('d', (circle.y for circle in circles)),
+        array('d', (circle.radius for circle in circles)),
+        contacts
+    )
+    assert any(contacts)
+    assert list(contacts) == [_callback_flags(physics_world, circle) for circle in circles]
+
+
+def test_collide_batch_matches_collide():
+    for seed in (1, 2):
+        world = World(98, seed)
+        world.generate()
+        floor = [(x, y) for x, y, tile in world.get_tiles().non_empty() if tile == TILE_FLOOR]
+        _check_batch_matches_callbacks(world, floor)
+
+
+def test_collide_batch_matches_collide_in_a_chunked_world():
+    world = ChunkedWorld(5)
+    floor = [(x, y) for x, y, tile in world.non_empty(-64, -64, 192, 192) if tile == TILE_FLOOR]
+    _check_batch_matches_callbacks(world, floor)
+
+
+def test_collide_batch_only_pages_in_the_chunks_of_the_circles():
+    world = ChunkedWorld(5)
+    size = world.get_chunk_size()
+    chunks = [(0, 0), (8, 0), (-8, 3)]
+    # a few circles in the middle of each chunk, far from any neighbouring chunk
+    xs = array('d', ((cx * size + size // 2) * TILE_SIZE + i * 20.0 for cx, cy in chunks for i in range(0, 3)))
+    ys = array('d', ((cy * size + size // 2) * TILE_SIZE + i * 20.0 for cx, cy in chunks for i in range(0, 3)))
+    radii = array('d', [16.0]) * len(xs)
+    contacts = array('B', bytes(len(xs)))
+
+    world.evict_all()
+    PhysicsWorld(world).collide_batch(xs, ys, radii, contacts)
+    assert sorted(world.get_resident_chunks()) == sorted(chunks)
+
+
+def test_apply_contacts_stops_each_touched_axis():
+    store = ActorStore()
+    actors = [Walker(16) for i in range(0, 4)]
+    for actor in actors:
+        actor.set_position(100.0, 200.0)
+        actor.set_velocity(30.0, -60.0)
+        store.add(actor, True)
+    store.update(0.5)
+    store.contacts[:] = array('B', (0, CONTACT_LEFT, CONTACT_TOP, CONTACT_RIGHT | CONTACT_BOTTOM))
+    store.apply_contacts()
+
+    assert [(actor.x, actor.y) for actor in actors] == [(115.0, 170.0), (100.0, 170.0), (115.0, 200.0), (100.0, 200.0)]
+    assert [actor.get_velocity() for actor in actors] == [(30.0, -60.0), (0.0, -60.0), (30.0, 0.0), (0.0, 0.0)]
+
+
+def test_store_actor_stops_where_the_callback_player_stops():
+    scene_manager = SceneManager(None)
+    scene = GameScene(scene_manager, seed=3, size=98)
+    scene_manager.push(scene)
+    player = scene.get_player()
+    walker = Walker(player.get_shape().radius)
+    walker.set_position(player.x, player.y)
+    walker.set_velocity(-player.VELOCITY, 0.0)
+    scene.add_actor(walker)
+
+    player.should_move_left = -1
+    positions = []
+    for i in range(0, 600):
+        scene_manager.on_update(1.0 / 60)
+        positions.append(walker.x)
+
+    # the walker ran into a wall, stopped for good and did so where the player did
+    assert walker.get_velocity() == (0.0, 0.0)
+    assert positions[-1] == positions[-100] < positions[0]
+    assert (walker.x, walker.y) == (player.x, player.y)
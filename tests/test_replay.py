@@ -0,0 +1,45 @@
+import pyglet.window.key
+
+from pw22.replay import InputRecorder, read_log, replay, EVENT_KEY_PRESS, EVENT_KEY_RELEASE
+from pw22.scenes import SceneManager, GameScene
+
+SEED = 7
+SIZE = 98
+STEP = 1.0 / 60
+
+
+def _play(scene_manager):
+    """
+    Walk the player around with key presses and releases between ticks
+    """
+    for symbol, ticks in ((pyglet.window.key.D, 30), (pyglet.window.key.W, 20), (pyglet.window.key.A, 15)):
+        scene_manager.on_key_press(symbol, 0)
+        for i in range(0, ticks):
+            scene_manager.on_update(STEP)
+        scene_manager.on_key_release(symbol, 0)
+    scene_manager.on_mouse_motion(10, 20, 1, 1)
+    scene_manager.on_update(STEP)
+
+
+def test_replay_ends_where_the_recorded_session_ended(tmp_path):
+    path = str(tmp_path / 'session.log')
+    scene_manager = SceneManager(None)
+    recorder = InputRecorder(path, SEED, SIZE)
+    scene_manager.set_recorder(recorder)
+    scene_manager.push(GameScene(scene_manager, seed=SEED, size=SIZE))
+    player = scene_manager.get_scene().get_player()
+    start = (player.x, player.y)
+    _play(scene_manager)
+    recorder.close()
+    assert (player.x, player.y) != start
+
+    header, events = read_log(path)
+    assert header == {'seed': SEED, 'size': SIZE, 'streaming': False}
+    assert sum(1 for event, arguments in events if event == EVENT_KEY_PRESS) == 3
+    assert sum(1 for event, arguments in events if event == EVENT_KEY_RELEASE) == 3
+
+    replayed = SceneManager(None)
+    timings = replay(header, events, scene_manager=replayed)
+    assert len(timings) == 66
+    replayed_player = replayed.get_scene().get_player()
+    assert (replayed_player.x, replayed_player.y) == (player.x, player.y)
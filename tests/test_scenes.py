@@ -0,0 +1,58 @@
+from pw22.scenes import SceneManager, Scene, GameScene
+
+STEP = 1.0 / 60
+
+
+class Overlay(Scene):
+    """
+    Scene covering the game, nothing in it needs a display
+    """
+
+    def on_init(self):
+        pass
+
+
+def test_push_compact_drops_the_world_and_pop_restores_it():
+    scene_manager = SceneManager(None)
+    scene = GameScene(scene_manager, seed=5, size=98)
+    scene_manager.push(scene)
+    scene_manager.on_update(STEP)
+
+    world = scene.get_world()
+    snapshot = world.get_snapshot()
+    explored = bytes(scene.get_visibility().explored)
+    assert any(explored)
+
+    scene_manager.push(Overlay(scene_manager), compact=True)
+    assert scene.get_world() is None
+    assert scene.get_visibility() is None
+    assert scene.get_pathfinder() is None
+
+    scene_manager.pop()
+    assert scene.get_world() is not world
+    assert scene.get_world().get_snapshot() == snapshot
+    assert bytes(scene.get_visibility().explored) == explored
+
+    # the scene runs on after expanding, with the player colliding with the restored world
+    position = (scene.get_player().x, scene.get_player().y)
+    scene_manager.on_update(STEP)
+    assert (scene.get_player().x, scene.get_player().y) == position
+    assert scene.get_pathfinder().find_path(*_two_room_centres(scene.get_world()))
+
+
+def _two_room_centres(world):
+    a, b = world.get_rooms()[:2]
+    return (
+        a.x + a.width // 2, a.y + a.height // 2,
+        b.x + b.width // 2, b.y + b.height // 2
+    )
+
+
+def test_steering_is_timed_per_actor_class():
+    scene_manager = SceneManager(None)
+    scene = GameScene(scene_manager, seed=5, size=98)
+    scene_manager.push(scene)
+    scene_manager.on_update(STEP)
+    scene_manager.profiler.end_frame()
+
+    assert 'update.Player' in scene_manager.profiler.get_percentiles()
@@ -0,0 +1,28 @@
+from pw22.physics import PhysicsWorld, Circle
+from pw22.streaming import ChunkedWorld
+from pw22.world import TILE_SIZE, TILE_FLOOR, TILE_WALL
+
+
+def _wall_with_floor_right_of_it(world, x0, y0):
+    for y in range(y0, y0 + 64):
+        for x in range(x0, x0 + 64):
+            if world.get_tile(x, y) != TILE_WALL:
+                continue
+            if all(world.get_tile(x + dx, y + dy) == TILE_FLOOR for dx in (1, 2) for dy in (-1, 0, 1)):
+                return x, y
+    return None
+
+
+def test_collide_left_of_and_below_the_origin():
+    world = ChunkedWorld(5)
+    physics_world = PhysicsWorld(world)
+    for cx, cy in ((-1, 0), (0, -1), (-1, -1)):
+        tile = _wall_with_floor_right_of_it(world, cx * 64, cy * 64)
+        assert tile
+        contacts = []
+        circle = Circle(16)
+        circle.set_callback(lambda **kwargs: contacts.append(kwargs))
+        circle.x = (tile[0] + 1) * TILE_SIZE + 10
+        circle.y = tile[1] * TILE_SIZE + TILE_SIZE / 2
+        physics_world.collide(circle)
+        assert {'right': True} in contacts
@@ -0,0 +1,29 @@
+from pw22.visibility import Visibility
+from pw22.world import World, TILE_FLOOR, TILE_WALL
+
+
+def test_field_of_view_is_recomputed_when_a_tile_within_sight_changes():
+    world = World(98, 6)
+    world.generate()
+    tiles = world.get_tiles()
+    room = world.get_rooms()[0]
+    x, y = room.x + room.width // 2, room.y + room.height // 2
+    visibility = Visibility(tiles)
+    assert visibility.update(x, y)
+    assert not visibility.update(x, y)
+
+    # a wall right next to the viewer casts a shadow on the tiles behind it
+    world.set_tile(x + 1, y, TILE_WALL)
+    assert visibility.update(x, y)
+    fresh = Visibility(tiles)
+    fresh.update(x, y)
+    assert visibility.visible == fresh.visible
+    assert not visibility.is_visible(x + 3, y)
+
+    world.set_tile(x + 1, y, TILE_FLOOR)
+    assert visibility.update(x, y)
+    assert visibility.is_visible(x + 3, y)
+
+    # a change out of sight leaves the field alone
+    world.set_tile(0 if x > tiles.size // 2 else tiles.size - 1, y, TILE_WALL)
+    assert not visibility.update(x, y)
@@ -0,0 +1,141 @@
+import random
+import struct
+from collections import deque
+
+import pytest
+
+from pw22.streaming import ChunkedWorld
+from pw22.world import (
+    World, TileMap, SNAPSHOT_FOOTER, GENERATOR_VERSION, SEED_LIMIT, TUNNEL_LOOPS, TILE_FLOOR, TILE_WALL
+)
+
+
+def _rooms(world):
+    return [(room.x, room.y, room.width, room.height) for room in world.get_rooms()]
+
+
+def _same_world(a, b):
+    assert (b.get_size(), b.get_seed()) == (a.get_size(), a.get_seed())
+    assert (b.get_spawn_x(), b.get_spawn_y()) == (a.get_spawn_x(), a.get_spawn_y())
+    assert _rooms(b) == _rooms(a)
+    assert bytes(b.get_tiles().data) == bytes(a.get_tiles().data)
+
+
+@pytest.fixture(scope='module')
+def world():
+    world = World(98, 11)
+    world.generate()
+    return world
+
+
+def test_snapshot_round_trip(world):
+    _same_world(world, World.from_snapshot(world.get_snapshot()))
+
+
+def test_save_and_load_round_trip(world, tmp_path):
+    path = str(tmp_path / 'world')
+    world.save(path)
+    loaded = World.load(path)
+    _same_world(world, loaded)
+
+    # the tiles are mapped copy-on-write, writing them leaves the file alone
+    loaded.set_tile(0, 0, 1)
+    _same_world(world, World.load(path))
+
+
+def test_snapshot_of_another_generator_version_is_rejected(world, tmp_path):
+    snapshot = bytearray(world.get_snapshot())
+    # the version follows the 4 byte magic in the footer
+    struct.pack_into('<H', snapshot, len(snapshot) - SNAPSHOT_FOOTER.size + 4, GENERATOR_VERSION - 1)
+    with pytest.raises(ValueError):
+        World.from_snapshot(bytes(snapshot))
+
+    path = tmp_path / 'world'
+    path.write_bytes(snapshot)
+    with pytest.raises(ValueError):
+        World.load(str(path))
+
+
+def test_not_a_snapshot_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        World.from_snapshot(b'\x00' * 64)
+
+    path = tmp_path / 'world'
+    path.write_bytes(b'\x00' * 64)
+    with pytest.raises(ValueError):
+        World.load(str(path))
+
+
+@pytest.mark.parametrize('seed', [-1, SEED_LIMIT, 2 ** 40])
+def test_seeds_a_snapshot_can_not_hold_are_rejected(seed):
+    with pytest.raises(ValueError):
+        World(98, seed)
+    with pytest.raises(ValueError):
+        ChunkedWorld(seed)
+
+
+def test_largest_seed_round_trips():
+    world = World(98, SEED_LIMIT - 1)
+    world.generate()
+    assert World.from_snapshot(world.get_snapshot()).get_seed() == SEED_LIMIT - 1
+
+
+def _dilate_by_hand(tiles, size, cells, tile):
+    expected = bytearray(tiles)
+    for x, y in cells:
+        for ny in range(max(y - 1, 0), min(y + 2, size)):
+            for nx in range(max(x - 1, 0), min(x + 2, size)):
+                if expected[ny * size + nx] == 0:
+                    expected[ny * size + nx] = tile
+    return expected
+
+
+def test_dilate_fills_only_the_empty_neighbours():
+    rng = random.Random(12)
+    size = 24
+    for i in range(0, 50):
+        tiles = TileMap(size, bytearray(rng.choice((0, 0, 0, TILE_FLOOR)) for j in range(0, size * size)))
+        # corners and edges included, the neighbourhood is clipped to the map there
+        cells = [(rng.choice((0, size - 1, rng.randrange(0, size))), rng.randrange(0, size)) for j in range(0, 12)]
+        expected = _dilate_by_hand(tiles.data, size, cells, TILE_WALL)
+        changes = []
+        tiles.add_listener(lambda *rectangle: changes.append(rectangle))
+
+        tiles.dilate(cells, TILE_WALL)
+        assert tiles.data == expected
+        x0, y0, x1, y1 = changes[0]
+        assert x0 == max(min(x for x, y in cells) - 1, 0)
+        assert y0 == max(min(y for x, y in cells) - 1, 0)
+        assert x1 == min(max(x for x, y in cells) + 1, size - 1)
+        assert y1 == min(max(y for x, y in cells) + 1, size - 1)
+
+
+def _reachable(tiles, x, y):
+    size = tiles.size
+    seen = {(x, y)}
+    queue = deque([(x, y)])
+    while queue:
+        x, y = queue.popleft()
+        for nx, ny in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+            if 0 <= nx < size and 0 <= ny < size and (nx, ny) not in seen and tiles.get_tile(nx, ny) == TILE_FLOOR:
+                seen.add((nx, ny))
+                queue.append((nx, ny))
+    return seen
+
+
+@pytest.mark.parametrize('seed,size', [(1, 98), (2, 98), (3, 160), (4, 256)])
+def test_tunnels_connect_every_room_with_one_search_per_tree_edge(seed, size, monkeypatch):
+    searches = []
+    find_path = World.find_path
+    monkeypatch.setattr(World, 'find_path', lambda self, *tiles: searches.append(tiles) or find_path(self, *tiles))
+
+    world = World(size, seed)
+    world.generate()
+    rooms = world.get_rooms()
+    tiles = world.get_tiles()
+    reachable = _reachable(tiles, rooms[0].x + 1, rooms[0].y + 1)
+    for room in rooms:
+        assert (room.x + 1, room.y + 1) in reachable
+
+    # a spanning tree needs one tunnel less than there are rooms, plus the few loops added on purpose
+    assert len(searches) <= len(rooms) - 1 + TUNNEL_LOOPS